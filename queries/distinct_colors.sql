@@ -1,5 +1,4 @@
-SELECT DISTINCT color
-FROM card_cost
-WHERE color NOT LIKE 'Multicolor'
-   AND color NOT LIKE 'X'
+SELECT name AS color
+FROM color_identity
+WHERE id IN (0, 1, 2, 4, 8, 16)
 ORDER BY color ASC
\ No newline at end of file
@@ -1,3 +1,4 @@
-SELECT DISTINCT type
-FROM card_type
-ORDER BY type ASC
\ No newline at end of file
+SELECT DISTINCT t.type
+FROM card_type AS ct
+JOIN type AS t ON t.id = ct.type_id
+ORDER BY t.type ASC
\ No newline at end of file
@@ -1,5 +1,5 @@
 SELECT
-    id,
+    card_id AS id,
     art_link,
     title,
     set_id,
@@ -8,9 +8,12 @@ SELECT
     COALESCE(cmc, 0) AS cmc,
     types,
     colors,
+    color_mask,
     color_identity,
     SUM(wins)/SUM(games) AS winrate,
-    SUM(games)/SUM(step_5.unique) AS popularity,
+    -- Shrunk win rates of the tiers, weighted like their games
+    SUM(shrunk_winrate * games)/SUM(games) AS shrunk_winrate,
+    SUM(games)/SUM(css.unique) AS popularity,
     SUM(games) AS games,
     CASE greatest(SUM(copies_1), SUM(copies_2), SUM(copies_3), SUM(copies_4))
         WHEN SUM(copies_1) THEN 1
@@ -18,17 +21,22 @@ SELECT
         WHEN SUM(copies_3) THEN 3
         WHEN SUM(copies_4) THEN 4
     END AS copies
-FROM {{#6-5-final-model}} AS step_5
-WHERE TRUE
+FROM card_snapshot_stats AS css
+WHERE snapshot_id = (
+    SELECT MAX(id)
+    FROM snapshot
+    -- Latest 'Ladder' snapshot unless another event is chosen
+    WHERE event = [[{{event}} --]] 'Ladder'
+)
   [[AND games >= {{games}}]]
   [[AND tier = {{tier}}]]
   [[AND set_id = {{set}}]]
   [[AND rarity = {{rarity}}]]
   [[AND is_legendary = {{legendary}}]]
-  [[AND colors LIKE CONCAT('%', {{color}}, '%')]]
-  [[AND color_identity LIKE {{color_identity}}]]
+  [[AND IF({{color}} = 'Colorless', color_mask = 0, color_mask & (SELECT id FROM color_identity WHERE name = {{color}}) > 0)]]
+  [[AND color_mask = (SELECT id FROM color_identity WHERE name = {{color_identity}})]]
   [[AND types LIKE CONCAT('%', {{type}}, '%')]]
   [[AND cmc = {{cmc}}]]
   [[AND UPPER(title) LIKE UPPER(CONCAT('%', {{title}}, '%'))]] 
-GROUP BY id
+GROUP BY card_id
 ORDER BY popularity DESC
\ No newline at end of file
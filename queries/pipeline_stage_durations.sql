@@ -0,0 +1,14 @@
+SELECT
+    DATE(r.created_on) AS 'date',
+    ps.stage,
+    SUM(ps.wall_seconds) AS wall_seconds,
+    SUM(ps.cpu_seconds) AS cpu_seconds,
+    MAX(ps.rss_bytes) AS rss_bytes,
+    SUM(ps.rows_out) AS rows_out
+FROM pipeline_run AS r
+INNER JOIN pipeline_stage AS ps
+    ON ps.run_id = r.id
+WHERE ps.parent = 'main'
+    [[AND ps.stage = {{stage}}]]
+GROUP BY DATE(r.created_on), ps.stage
+ORDER BY DATE(r.created_on) ASC
\ No newline at end of file
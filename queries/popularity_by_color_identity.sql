@@ -12,5 +12,5 @@ WHERE TRUE
   [[AND cmc = {{cmc}}]]
   [[AND is_legendary = {{legendary}}]]
   [[AND types LIKE CONCAT('%', {{type}}, '%')]]
-GROUP BY color_identity
+GROUP BY color_mask, color_identity
 ORDER BY popularity DESC
\ No newline at end of file
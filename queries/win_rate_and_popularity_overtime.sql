@@ -1,12 +1,16 @@
 SELECT
-    SUM(ag.wins)/SUM(ag.games) AS winrate,
-    SUM(ag.games)/SUM(d.total) AS popularity,
-    DATE(ag.created_on) AS 'date'
-FROM analytics_games AS ag
-LEFT JOIN card AS c
-    ON ag.card_id = c.id
-LEFT JOIN distinct_games AS d
-    ON ag.distinct_id = d.id 
+    SUM(cds.wins)/SUM(cds.games) AS winrate,
+    SUM(cds.games)/SUM(cds.total) AS popularity,
+    cds.day AS 'date'
+FROM card AS c
+INNER JOIN card_daily_stats AS cds
+    ON cds.card_id = c.id
 WHERE c.art_link = {{art}}
-    [[AND ag.tier = {{tier}}]]
-GROUP BY c.id, DATE(ag.created_on)
\ No newline at end of file
+    AND cds.format_id IN (
+        SELECT format_id
+        FROM snapshot
+        -- 'Ladder' formats unless another event is chosen
+        WHERE event = [[{{event}} --]] 'Ladder'
+    )
+    [[AND cds.tier = {{tier}}]]
+GROUP BY c.id, cds.day
\ No newline at end of file
@@ -0,0 +1,16 @@
+SELECT
+    archetype.code AS archetype,
+    SUM(ag.wins)/SUM(ag.games) AS winrate,
+    SUM(ag.games) AS games
+FROM archetype_games AS ag
+JOIN archetype ON archetype.id = ag.archetype_id
+WHERE ag.snapshot_id = (
+    SELECT MAX(id)
+    FROM snapshot
+    -- Latest 'Ladder' snapshot unless another event is chosen
+    WHERE event = [[{{event}} --]] 'Ladder'
+)
+  [[AND ag.tier = {{tier}}]]
+  [[AND ag.card_id = (SELECT id FROM card WHERE title = {{title}} LIMIT 1)]]
+GROUP BY archetype.code
+ORDER BY games DESC
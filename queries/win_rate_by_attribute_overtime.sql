@@ -0,0 +1,19 @@
+SELECT
+    value,
+    SUM(wins)/SUM(games) AS winrate,
+    SUM(games) AS games,
+    MAX(titles) AS distinct_titles,
+    day AS 'date'
+FROM attribute_daily_stats
+-- One of 'type', 'color_identity', 'rarity' or 'cmc'
+WHERE attribute = {{attribute}}
+    AND format_id IN (
+        SELECT format_id
+        FROM snapshot
+        -- 'Ladder' formats unless another event is chosen
+        WHERE event = [[{{event}} --]] 'Ladder'
+    )
+    [[AND tier = {{tier}}]]
+    [[AND value = {{value}}]]
+GROUP BY day, value
+ORDER BY day, games DESC
\ No newline at end of file
@@ -11,5 +11,5 @@ WHERE TRUE
   [[AND cmc = {{cmc}}]]
   [[AND is_legendary = {{legendary}}]]
   [[AND types LIKE CONCAT('%', {{type}}, '%')]]
-GROUP BY color_identity
+GROUP BY color_mask, color_identity
 ORDER BY winrate DESC
\ No newline at end of file
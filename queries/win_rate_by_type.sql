@@ -10,8 +10,8 @@ WITH
           [[AND set_id = {{set}}]]
           [[AND rarity = {{rarity}}]]
           [[AND is_legendary = {{legendary}}]]
-          [[AND colors LIKE CONCAT('%', {{color}}, '%')]]
-          [[AND color_identity LIKE {{color_identity}}]]
+          [[AND IF({{color}} = 'Colorless', color_mask = 0, color_mask & (SELECT id FROM color_identity WHERE name = {{color}}) > 0)]]
+          [[AND color_mask = (SELECT id FROM color_identity WHERE name = {{color_identity}})]]
           [[AND cmc = {{cmc}}]]
         GROUP BY id)
 
@@ -1,24 +1,30 @@
-WITH 
-    wr_table AS(
-        SELECT
-            SUM(wins)/SUM(games) AS winrate
-        FROM {{#6-5-final-model}} AS step_5
-        WHERE TRUE
-          [[AND games >= {{games}}]]
-          [[AND tier = {{tier}}]]
-          [[AND set_id = {{set}}]]
-          [[AND rarity = {{rarity}}]]
-          [[AND colors LIKE CONCAT('%', {{color}}, '%')]]
-          [[AND color_identity LIKE {{color_identity}}]]
-          [[AND types LIKE CONCAT('%', {{type}})]]
-          [[AND UPPER(title) LIKE UPPER(CONCAT('%', {{title}}, '%'))]] 
-        GROUP BY id),
-        
-    histogram AS (
-        SELECT 
-            FLOOR(winrate*20)/20 AS bins,
-            COUNT(winrate) AS count
-        FROM wr_table
-        GROUP BY bins)
+WITH
+    latest AS (
+        SELECT MAX(id) AS id
+        FROM snapshot
+        -- Latest 'Ladder' snapshot unless another event is chosen
+        WHERE event = [[{{event}} --]] 'Ladder'
+    )
 
-SELECT * FROM histogram
\ No newline at end of file
+SELECT
+    bin/20 AS bins,
+    SUM(cards) AS count
+FROM win_rate_histogram_cube
+WHERE snapshot_id = (SELECT id FROM latest)
+  -- Unfiltered tiers and types are stored as 'ALL'
+  AND tier = [[{{tier}} --]] 'ALL'
+  AND type = [[{{type}} --]] 'ALL'
+  -- Cards reaching the largest games threshold below the filter
+  AND games_min = (
+      SELECT MAX(games_min)
+      FROM win_rate_histogram_cube
+      WHERE snapshot_id = (SELECT id FROM latest)
+        AND games_min <= [[{{games}} --]] 0
+  )
+  [[AND set_id = {{set}}]]
+  [[AND rarity = {{rarity}}]]
+  [[AND cmc = {{cmc}}]]
+  [[AND is_legendary = {{legendary}}]]
+  [[AND IF({{color}} = 'Colorless', color_mask = 0, color_mask & (SELECT id FROM color_identity WHERE name = {{color}}) > 0)]]
+  [[AND color_mask = (SELECT id FROM color_identity WHERE name = {{color_identity}})]]
+GROUP BY bins
\ No newline at end of file
@@ -22,5 +22,5 @@ SELECT
     SUM(games) AS Popularity,
     COUNT(*) AS 'Distinct titles'
 FROM title_agg
-GROUP BY color_identity
+GROUP BY color_mask, color_identity
 ORDER BY SUM(games) DESC
\ No newline at end of file
@@ -1,110 +1,196 @@
 """Analytics dataframes to be written in the database"""
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+import os
+
+import numpy as np
 import pandas as pd
 
-from raw import request_analytics
+from instrument import call_in_worker, instrument, merge_stages
+from raw import fetch, stream_analytics
+from schema import apply_schema
 
 
-def filter_raw_distinct_games(raw_distinct_games):
-    """Unnest the 'raw_distinct_games' columns and makes tier names more explicit"""
-    # Reset index and rename tiers
-    distinct_df = raw_distinct_games.reset_index().rename(columns={"index": "raw"})
+# Processes transforming the analytics of different formats at once
+WORKERS = int(os.getenv("UNTAPPED_WORKERS", str(os.cpu_count() or 1)))
 
-    # Split raw column into multiple columns
-    columns = ["tier", "archetype_id"]
-    distinct_df[columns] = distinct_df.raw.str.split(".", expand=True)
+# Abbreviations used by each section of the analytics JSON
+TIERS = {"b": "Bronze", "s": "Silver", "g": "Gold", "p": "Platinum"}
+DISTINCT_TIERS = {
+    "bronze": "Bronze",
+    "silver": "Silver",
+    "gold": "Gold",
+    "platinum": "Platinum",
+}
 
-    # Record only consolidated data by archetype
-    distinct_df = distinct_df[distinct_df.archetype_id == "ALL"].drop(
-        ["raw", "archetype_id"], axis=1
-    )
 
-    # Replace abbreviations with tier full names
-    distinct_df.replace(
-        {
-            "bronze": "Bronze",
-            "silver": "Silver",
-            "gold": "Gold",
-            "platinum": "Platinum",
-        },
-        inplace=True,
+def get_tier_names(codes, abbreviations):
+    """Maps tier abbreviations to full names through a categorical lookup"""
+    return pd.Categorical(codes, categories=list(abbreviations)).rename_categories(
+        abbreviations
     )
 
-    # Rename column to games and set index to tier
-    distinct_df = distinct_df.rename(columns={0: "total"}).set_index("tier")
 
-    return distinct_df
+@instrument
+def filter_raw_distinct_games(raw_distinct_games):
+    """Returns the 'tier.archetype' keyed totals of archetype 'ALL' as columns"""
+    # Keep consolidated data by archetype before parsing any key
+    keys = raw_distinct_games.index.str
+    kept = keys.endswith(".ALL")
+
+    return {
+        "tier": keys.slice(stop=-4)[kept].to_numpy(dtype=object),
+        "total": raw_distinct_games[0].to_numpy()[kept].astype(np.int64),
+    }
 
 
+@instrument
 def filter_raw_analytics(raw_analytics):
-    """Unnest the 'raw_analytics' columns and makes tier names more explicit"""
-    # Reset index and rename tiers
-    analytics_df = raw_analytics.reset_index().rename(columns={"index": "raw"})
-
-    # Split raw column into multiple columns
-    columns = ["card_id", "archetype_id", "tier"]
-    analytics_df[columns] = analytics_df.raw.str.split(".", expand=True)
-
-    # Record only consolidated data by archetype and change index to titleId
-    analytics_df = (
-        analytics_df[analytics_df.archetype_id == "ALL"]
-        .drop(["raw", "archetype_id"], axis=1)
-        .set_index("card_id")
+    """Returns the 'card.archetype.tier' keyed statistics of 'ALL' as columns"""
+    # Keep consolidated data by archetype before parsing any key
+    kept = raw_analytics.index.str.contains(".ALL.", regex=False)
+    keys = raw_analytics.index[kept].str
+    values = raw_analytics[0].to_numpy()[kept]
+
+    # Unnest statistics in a single pass over preallocated arrays
+    rows = len(values)
+    games = np.empty(rows, dtype=np.int64)
+    wins = np.empty(rows, dtype=np.int64)
+    copies = np.full((rows, 4), np.nan)
+
+    for row, (stats, *_) in enumerate(values):
+        games[row], wins[row] = stats[0], stats[1]
+        played = stats[3][:4]
+        copies[row, : len(played)] = [np.nan if x is None else x for x in played]
+
+    return {
+        "card_id": keys.partition(".").get_level_values(0).astype(np.int64).to_numpy(),
+        "tier": keys.rpartition(".").get_level_values(2).to_numpy(dtype=object),
+        "games": games,
+        "wins": wins,
+        "copies": copies,
+    }
+
+
+@instrument
+def get_distinct_games(distinct):
+    """Returns data frame 'distinct_games'"""
+    distinct_games = pd.DataFrame(
+        {"total": distinct["total"]},
+        index=pd.CategoricalIndex(
+            get_tier_names(distinct["tier"], DISTINCT_TIERS), name="tier"
+        ),
+    )
+    return apply_schema("distinct_games", distinct_games)
+
+
+@instrument
+def get_analytics_games(columns):
+    """Returns data frame 'analytics_games'"""
+    analytics_games = pd.DataFrame(
+        {
+            "tier": get_tier_names(columns["tier"], TIERS),
+            "games": columns["games"],
+            "wins": columns["wins"],
+        },
+        index=pd.Index(columns["card_id"], name="card_id"),
     )
+    return apply_schema("analytics_games", analytics_games)
 
-    # Replace abbreviations with tier full names
-    analytics_df.replace(
-        {"b": "Bronze", "s": "Silver", "g": "Gold", "p": "Platinum"}, inplace=True
+
+@instrument
+def get_analytics_distribution(columns):
+    """Returns data frame 'analytics_distribution'"""
+    # Lay copies out column by column, as melting them would
+    copies = columns["copies"]
+    played = copies.ravel(order="F")
+    kept = ~np.isnan(played)
+
+    distribution = pd.DataFrame(
+        {
+            "tier": get_tier_names(np.tile(columns["tier"], 4)[kept], TIERS),
+            "copies": np.repeat(np.arange(1, 5), len(copies))[kept],
+            "played": played[kept],
+        },
+        index=pd.Index(np.tile(columns["card_id"], 4)[kept], name="card_id"),
     )
 
-    # Unnest statistics
-    unnest = ["games", "wins", "check", "copies"]
-    analytics_df[unnest] = pd.DataFrame(
-        analytics_df.explode([0])[0].to_list(), index=analytics_df.index
-    ).iloc[:, :4]
+    return apply_schema("analytics_distribution", distribution)
 
-    # Set index to integer
-    analytics_df.index = analytics_df.index.astype("int64", copy=False)
 
-    return analytics_df[["tier", "games", "wins", "copies"]]
+def get_archetype_ids(codes, archetype_ids):
+    """Maps archetype codes to their ids through a vectorized index lookup"""
+    return archetype_ids.to_numpy()[archetype_ids.index.get_indexer(codes)]
 
 
-def get_analytics_distribution(filtered_df):
-    """Returns data frame 'analytics_distribution'"""
-    # Unnest copies
-    unnest = [1, 2, 3, 4]
-    filtered_df[unnest] = pd.DataFrame(
-        filtered_df.copies.to_list(), index=filtered_df.index
+@instrument
+def get_archetype_distinct_games(distinct, archetype_ids):
+    """Returns data frame 'archetype_distinct_games' of a batch"""
+    archetype_distinct_games = pd.DataFrame(
+        {
+            "archetype_id": get_archetype_ids(distinct["archetype"], archetype_ids),
+            "tier": get_tier_names(distinct["tier"], DISTINCT_TIERS),
+            "total": distinct["total"],
+        }
     )
+    return apply_schema("archetype_distinct_games", archetype_distinct_games)
 
-    filtered_df = (
-        filtered_df.reset_index()
-        .melt(
-            id_vars=["card_id", "tier"],
-            value_vars=unnest,
-            var_name="copies",
-            value_name="played",
-        )
-        .set_index("card_id")
-        .dropna()
-    )
 
-    return filtered_df
+@instrument
+def get_archetype_games(columns, archetype_ids):
+    """Returns data frame 'archetype_games' of a batch, copies laid out as columns"""
+    archetype_games = pd.DataFrame(
+        {
+            "card_id": columns["card_id"],
+            "archetype_id": get_archetype_ids(columns["archetype"], archetype_ids),
+            "tier": get_tier_names(columns["tier"], TIERS),
+            "games": columns["games"],
+            "wins": columns["wins"],
+            **{f"copies_{n}": columns["copies"][:, n - 1] for n in range(1, 5)},
+        }
+    )
+    return apply_schema("archetype_games", archetype_games)
 
 
+@instrument
 def get_analytics(format_id):
     """Returns 'distinct_games', 'analytics_distribution', 'analytics_games'"""
 
-    raw_distinct_games, raw_analytics = request_analytics(format_id)
+    distinct, columns = stream_analytics(format_id)
 
-    distinct_games = filter_raw_distinct_games(raw_distinct_games)
+    distinct_games = get_distinct_games(distinct)
+    analytics_games = get_analytics_games(columns)
+    analytics_distribution = get_analytics_distribution(columns)
 
-    filtered = filter_raw_analytics(raw_analytics)
+    return distinct_games, analytics_games, analytics_distribution
 
-    analytics_games = filtered[["tier", "games", "wins"]]
-    analytics_distribution = get_analytics_distribution(filtered)
 
-    return distinct_games, analytics_games, analytics_distribution
+@instrument
+def get_analytics_by_format(format_ids, workers=WORKERS):
+    """
+    Returns the analytics of several formats, downloading them under the
+    rate limit first and then transforming them in parallel processes
+    """
+    with ThreadPoolExecutor(max_workers=max(len(format_ids), 1)) as executor:
+        list(executor.map(lambda f_id: fetch("analytics", False, f_id), format_ids))
+
+    # Forked workers inherit the fetched keys, so they never touch the network
+    workers = min(workers, len(format_ids))
+    if workers <= 1:
+        return {format_id: get_analytics(format_id) for format_id in format_ids}
+
+    # Workers send their stages back along with the analytics, as forked
+    # processes only record into their own copy of the run
+    analytics = {}
+    with ProcessPoolExecutor(workers, mp_context=get_context("fork")) as executor:
+        results = executor.map(partial(call_in_worker, get_analytics), format_ids)
+        for format_id, (result, stages) in zip(format_ids, results):
+            merge_stages(stages)
+            analytics[format_id] = result
+
+    return analytics
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+"""Columnar archive of the frames of every run, partitioned by format and date"""
+
+from datetime import date
+from hashlib import blake2b
+from pathlib import Path
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from instrument import instrument
+from raw import stream_archetypes
+
+
+# Archive location can be moved through an environment variable
+ARCHIVE_DIR = os.getenv("UNTAPPED_ARCHIVE_DIR", ".archive/untapped")
+COMPRESSION = "zstd"
+
+# Each run lands in a 'format_id=x/date=y' directory of every frame
+PARTITIONING = ds.partitioning(
+    pa.schema([("format_id", pa.int64()), ("date", pa.string())]), flavor="hive"
+)
+
+# Card statistics of every archetype, as flattened while streaming the payload
+STATISTICS_SCHEMA = pa.schema(
+    [
+        ("card_id", pa.int64()),
+        ("archetype", pa.string()),
+        ("tier", pa.string()),
+        ("games", pa.int64()),
+        ("wins", pa.int64()),
+    ]
+    + [(f"copies_{copies}", pa.float64()) for copies in range(1, 5)]
+)
+
+
+def write_partition(partition, filename, schema, tables):
+    """Writes tables as the row groups of one compressed Parquet file"""
+    partition.mkdir(parents=True, exist_ok=True)
+
+    # Write aside and rename, so readers never see partial files
+    path = partition / filename
+    partial = path.with_suffix(".partial")
+    with pq.ParquetWriter(partial, schema, compression=COMPRESSION) as writer:
+        for table in tables:
+            writer.write_table(table)
+    os.replace(partial, path)
+
+    return path
+
+
+def get_partition(name, format_id, day=None):
+    """Returns the directory of a frame for a format and date"""
+    day = day or date.today()
+    return Path(
+        ARCHIVE_DIR, name, f"format_id={int(format_id)}", f"date={day.isoformat()}"
+    )
+
+
+def archive_frame(name, dataframe, format_id, snapshot_id, day=None):
+    """Writes a data frame as one compressed Parquet file of its partition"""
+    table = pa.Table.from_pandas(dataframe)
+    return write_partition(
+        get_partition(name, format_id, day),
+        f"snapshot-{snapshot_id}.parquet",
+        table.schema,
+        [table],
+    )
+
+
+def get_statistics_table(columns):
+    """Returns a batch of streamed card statistics as an Arrow table"""
+    copies = columns.pop("copies")
+    for index in range(copies.shape[1]):
+        columns[f"copies_{index + 1}"] = np.ascontiguousarray(copies[:, index])
+    return pa.table(columns, schema=STATISTICS_SCHEMA)
+
+
+def archive_statistics(format_id, snapshot_id, day=None):
+    """
+    Archives the card statistics and distinct games of every archetype,
+    one batch of the analytics payload at a time
+    """
+    distinct = []
+
+    def tables():
+        for kind, columns in stream_archetypes(format_id, skip=()):
+            if kind == "distinct":
+                distinct.append(columns)
+            else:
+                yield get_statistics_table(columns)
+
+    path = write_partition(
+        get_partition("statistics", format_id, day),
+        f"snapshot-{snapshot_id}.parquet",
+        STATISTICS_SCHEMA,
+        tables(),
+    )
+    for columns in distinct:
+        archive_frame(
+            "distinct_statistics", pd.DataFrame(columns), format_id, snapshot_id, day
+        )
+
+    return path
+
+
+@instrument
+def archive_run(format_id, snapshot_id, analytics):
+    """Archives the card statistics and every analytics frame written by a run"""
+    archive_statistics(format_id, snapshot_id)
+
+    names = ["distinct_games", "analytics_games", "analytics_distribution"]
+    for name, dataframe in zip(names, analytics):
+        archive_frame(name, dataframe, format_id, snapshot_id)
+
+    print(f"Archived snapshot {snapshot_id} into '{ARCHIVE_DIR}'")
+
+
+@instrument
+def archive_cards(card_dataframes, sources, snapshot_id):
+    """
+    Archives card frames once per version of the card data, identified
+    by the fingerprints of its 'sources', along the first snapshot using it
+    """
+    fingerprint = blake2b(json.dumps(sources).encode(), digest_size=8).hexdigest()
+
+    archived = 0
+    for card_df in card_dataframes:
+        partition = Path(
+            ARCHIVE_DIR, "cards", card_df.name, f"fingerprint={fingerprint}"
+        )
+        if partition.exists():
+            continue
+
+        table = pa.Table.from_pandas(card_df)
+        write_partition(
+            partition, f"snapshot-{snapshot_id}.parquet", table.schema, [table]
+        )
+        archived += 1
+
+    if archived:
+        print(f"Archived {archived} card frames of version {fingerprint}")
+
+
+def open_archive(name):
+    """Returns a lazy dataset over every partition of an archived frame"""
+    return ds.dataset(
+        Path(ARCHIVE_DIR, name), format="parquet", partitioning=PARTITIONING
+    )
+
+
+def read_archive(name, start=None, end=None, format_id=None, columns=None, where=None):
+    """
+    Reads an archived frame between two dates, scanning only the
+    partitions, row groups and columns the filters and projection need
+    """
+    expression = ds.scalar(True)
+    if start is not None:
+        expression &= ds.field("date") >= str(start)
+    if end is not None:
+        expression &= ds.field("date") <= str(end)
+    if format_id is not None:
+        expression &= ds.field("format_id") == int(format_id)
+    if where is not None:
+        expression &= where
+
+    return open_archive(name).to_table(columns=columns, filter=expression).to_pandas()
+
+
+def read_cards(name, snapshot_id=None):
+    """Reads an archived card frame as of a snapshot, the latest by default"""
+    paths = {
+        int(path.stem.removeprefix("snapshot-")): path
+        for path in Path(ARCHIVE_DIR, "cards", name).glob("*/snapshot-*.parquet")
+    }
+    archived = [key for key in paths if snapshot_id is None or key <= snapshot_id]
+    if not archived:
+        raise ValueError(f"No '{name}' card frame archived as of {snapshot_id}")
+
+    return pq.read_table(paths[max(archived)]).to_pandas()
+
+
+if __name__ == "__main__":
+    print(read_archive("analytics_games", columns=["card_id", "tier", "games"]))
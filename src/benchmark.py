@@ -0,0 +1,595 @@
+"""
+Benchmarks the fetch, transform and load stages on recorded fixtures,
+failing when a case regresses against a stored baseline
+"""
+
+from contextlib import redirect_stdout
+from multiprocessing import Pipe, get_context
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import argparse
+import io
+import json
+import os
+import re
+import resource
+import sys
+import tracemalloc
+
+import pandas as pd
+
+from analytics import (
+    filter_raw_analytics,
+    filter_raw_distinct_games,
+    get_analytics,
+    get_analytics_by_format,
+    get_analytics_distribution,
+    get_analytics_games,
+    get_distinct_games,
+)
+from card import (
+    Localization,
+    filter_raw_card,
+    get_card_ability,
+    get_card_cost,
+    get_card_dataframe,
+    get_card_hashes,
+    get_card_information,
+    get_card_subtype,
+    get_card_type,
+)
+from database import get_engine, unit_of_work
+from main import (
+    write_analytics,
+    write_archetype_analytics,
+    write_card,
+    write_card_snapshot_stats,
+    write_daily_rollups,
+    write_dataframe,
+    write_histogram_cube,
+    write_set,
+)
+from migrations import migrate
+from models import create_all, drop_all
+from raw import (
+    CACHE,
+    clear_requests,
+    request_active,
+    request_analytics,
+    request_cards,
+    request_formats,
+    request_text,
+    set_mode,
+    stream_analytics,
+)
+
+
+# Where measurements are kept between runs, and the tolerated slowdown
+BASELINE = ".benchmarks/baseline.json"
+THRESHOLD = 20
+
+
+def baseline_filter_raw_distinct_games(raw_distinct_games):
+    """Original split-then-filter implementation of 'filter_raw_distinct_games'"""
+    distinct_df = raw_distinct_games.reset_index().rename(columns={"index": "raw"})
+
+    columns = ["tier", "archetype_id"]
+    distinct_df[columns] = distinct_df.raw.str.split(".", expand=True)
+
+    distinct_df = distinct_df[distinct_df.archetype_id == "ALL"].drop(
+        ["raw", "archetype_id"], axis=1
+    )
+
+    distinct_df.replace(
+        {
+            "bronze": "Bronze",
+            "silver": "Silver",
+            "gold": "Gold",
+            "platinum": "Platinum",
+        },
+        inplace=True,
+    )
+
+    return distinct_df.rename(columns={0: "total"}).set_index("tier")
+
+
+def baseline_filter_raw_analytics(raw_analytics):
+    """Original split-then-filter implementation of 'filter_raw_analytics'"""
+    analytics_df = raw_analytics.reset_index().rename(columns={"index": "raw"})
+
+    columns = ["card_id", "archetype_id", "tier"]
+    analytics_df[columns] = analytics_df.raw.str.split(".", expand=True)
+
+    analytics_df = (
+        analytics_df[analytics_df.archetype_id == "ALL"]
+        .drop(["raw", "archetype_id"], axis=1)
+        .set_index("card_id")
+    )
+
+    analytics_df.replace(
+        {"b": "Bronze", "s": "Silver", "g": "Gold", "p": "Platinum"}, inplace=True
+    )
+
+    unnest = ["games", "wins", "check", "copies"]
+    analytics_df[unnest] = pd.DataFrame(
+        analytics_df.explode([0])[0].to_list(), index=analytics_df.index
+    ).iloc[:, :4]
+
+    analytics_df.index = analytics_df.index.astype("int64", copy=False)
+
+    return analytics_df[["tier", "games", "wins", "copies"]]
+
+
+def baseline_get_analytics_distribution(filtered_df):
+    """Original melt implementation of 'get_analytics_distribution'"""
+    unnest = [1, 2, 3, 4]
+    filtered_df[unnest] = pd.DataFrame(
+        filtered_df.copies.to_list(), index=filtered_df.index
+    )
+
+    return (
+        filtered_df.reset_index()
+        .melt(
+            id_vars=["card_id", "tier"],
+            value_vars=unnest,
+            var_name="copies",
+            value_name="played",
+        )
+        .set_index("card_id")
+        .dropna()
+    )
+
+
+def before(raw_distinct_games, raw_analytics):
+    """Runs the original analytics transform"""
+    distinct_games = baseline_filter_raw_distinct_games(raw_distinct_games)
+    filtered = baseline_filter_raw_analytics(raw_analytics)
+    analytics_games = filtered[["tier", "games", "wins"]]
+    analytics_distribution = baseline_get_analytics_distribution(filtered)
+    return distinct_games, analytics_games, analytics_distribution
+
+
+def after(raw_distinct_games, raw_analytics):
+    """Runs the vectorized analytics transform"""
+    distinct_games = get_distinct_games(filter_raw_distinct_games(raw_distinct_games))
+    columns = filter_raw_analytics(raw_analytics)
+    analytics_games = get_analytics_games(columns)
+    analytics_distribution = get_analytics_distribution(columns)
+    return distinct_games, analytics_games, analytics_distribution
+
+
+def measure(function, *args, repeat=5):
+    """Returns best wall time and peak traced memory of a function"""
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function(*args)
+        timings.append(perf_counter() - start)
+
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return min(timings), peak
+
+
+def get_card_inputs():
+    """Returns filtered cards indexed by 'card_id' along with their localization"""
+    filtered = filter_raw_card(request_cards(request_active()[1]))
+    filtered = filtered.set_index("titleId").rename_axis("card_id")
+    return filtered, Localization(request_text())
+
+
+def get_fetch_cases():
+    """
+    Returns the cases reading and parsing the recorded bodies, each repeat
+    forgetting the bodies parsed so far
+    """
+    format_id = request_active()[0]
+    sets = request_active()[1]
+
+    def parsed_again(*arguments):
+        clear_requests()
+        return arguments
+
+    return {
+        "raw.request_analytics": (
+            lambda: parsed_again(format_id),
+            lambda format_id: len(request_analytics(format_id)[1]),
+        ),
+        "raw.stream_analytics": (
+            lambda: parsed_again(format_id),
+            lambda format_id: len(stream_analytics(format_id)[1]["card_id"]),
+        ),
+        "raw.request_cards": (
+            lambda: parsed_again(sets),
+            lambda sets: len(request_cards(sets)),
+        ),
+        "raw.request_text": (
+            parsed_again,
+            lambda: len(request_text()),
+        ),
+    }
+
+
+def get_transform_cases():
+    """
+    Returns the cases of every public transform, as a setup building
+    the inputs and a function returning the number of rows it produced
+    """
+    format_id = request_active()[0]
+
+    def analytics():
+        return request_analytics(format_id)
+
+    def columns():
+        return (filter_raw_analytics(request_analytics(format_id)[1]),)
+
+    def raw_card():
+        return (filter_raw_card(request_cards(request_active()[1])),)
+
+    return {
+        "analytics.filter_raw_distinct_games": (
+            analytics,
+            lambda distinct, _: len(filter_raw_distinct_games(distinct)["tier"]),
+        ),
+        "analytics.filter_raw_analytics": (
+            analytics,
+            lambda _, raw: len(filter_raw_analytics(raw)["card_id"]),
+        ),
+        "analytics.get_distinct_games": (
+            analytics,
+            lambda distinct, _: len(
+                get_distinct_games(filter_raw_distinct_games(distinct))
+            ),
+        ),
+        "analytics.get_analytics_games": (
+            columns,
+            lambda columns: len(get_analytics_games(columns)),
+        ),
+        "analytics.get_analytics_distribution": (
+            columns,
+            lambda columns: len(get_analytics_distribution(columns)),
+        ),
+        "analytics.get_analytics": (
+            lambda: (format_id,),
+            lambda format_id: len(get_analytics(format_id)[1]),
+        ),
+        "analytics.get_analytics_by_format": (
+            lambda: ([f_id for f_id, _, _ in request_formats()],),
+            lambda format_ids: sum(
+                len(analytics[1])
+                for analytics in get_analytics_by_format(format_ids).values()
+            ),
+        ),
+        "card.Localization": (
+            lambda: (request_text(),),
+            lambda raw_text: len(Localization(raw_text).ids),
+        ),
+        "card.filter_raw_card": (
+            lambda: (request_cards(request_active()[1]),),
+            lambda raw_card: len(filter_raw_card(raw_card)),
+        ),
+        "card.get_card_dataframe": (
+            lambda: (*raw_card(), Localization(request_text())),
+            lambda filtered, localization: len(
+                get_card_dataframe(filtered, localization)
+            ),
+        ),
+        "card.get_card_type": (
+            get_card_inputs,
+            lambda filtered, localization: len(get_card_type(filtered, localization)),
+        ),
+        "card.get_card_subtype": (
+            get_card_inputs,
+            lambda filtered, localization: len(
+                get_card_subtype(filtered, localization)
+            ),
+        ),
+        "card.get_card_cost": (
+            lambda: get_card_inputs()[:1],
+            lambda filtered: len(get_card_cost(filtered)[0]),
+        ),
+        "card.get_card_ability": (
+            get_card_inputs,
+            lambda filtered, localization: len(
+                get_card_ability(filtered, localization)
+            ),
+        ),
+        "card.get_card_hashes": (
+            lambda: get_card_information(request_active()[1]),
+            lambda *card_dataframes: len(get_card_hashes(*card_dataframes)),
+        ),
+        "card.get_card_information": (
+            lambda: (request_active()[1],),
+            lambda sets: sum(map(len, get_card_information(sets))),
+        ),
+    }
+
+
+def get_load_cases(database_url):
+    """
+    Returns the cases of every writing step of 'main.py', each one
+    starting from a database holding only what the step depends on
+    """
+    engine = get_engine(database_url)
+
+    def reset():
+        drop_all(engine)
+        create_all(engine)
+        migrate(engine)
+
+    def in_unit_of_work(step):
+        """Wraps a step so it runs and commits in its own unit of work"""
+
+        def case(*arguments):
+            with unit_of_work(engine) as session:
+                return step(session, *arguments)
+
+        return case
+
+    def with_tables():
+        reset()
+        return ()
+
+    def with_cards():
+        reset()
+        with unit_of_work(engine) as session:
+            write_card(session.connection(), request_active()[1])
+        return (request_active()[0],)
+
+    def with_analytics():
+        (format_id,) = with_cards()
+        with unit_of_work(engine) as session:
+            return write_analytics(session, format_id)
+
+    def with_snapshot():
+        snapshot_id, *_ = with_analytics()
+        return snapshot_id, request_active()[0]
+
+    def with_stats():
+        snapshot_id, *analytics = with_analytics()
+        with unit_of_work(engine) as session:
+            stats = write_card_snapshot_stats(session, snapshot_id, *analytics)
+        return snapshot_id, request_active()[0], stats
+
+    def card(session):
+        return sum(map(len, write_card(session.connection(), request_active()[1])))
+
+    def snapshot_stats(session, snapshot_id, *analytics):
+        write_card_snapshot_stats(session, snapshot_id, *analytics)
+        return len(analytics[1])
+
+    def dataframe(session, _, __, stats):
+        write_dataframe(session, "card_snapshot_stats", stats)
+        return len(stats)
+
+    def histogram_cube(session, snapshot_id, format_id, stats):
+        write_histogram_cube(session, snapshot_id, format_id, stats)
+        return len(stats)
+
+    def daily_rollups(session, snapshot_id, _, stats):
+        write_daily_rollups(session, snapshot_id, stats)
+        return len(stats)
+
+    return {
+        "main.write_set": (
+            with_tables,
+            in_unit_of_work(
+                lambda session: len(write_set(session, request_active()[1]))
+            ),
+        ),
+        "main.write_card": (with_tables, in_unit_of_work(card)),
+        "main.write_analytics": (
+            with_cards,
+            in_unit_of_work(
+                lambda session, format_id: sum(
+                    map(len, write_analytics(session, format_id)[1:])
+                )
+            ),
+        ),
+        "main.write_card_snapshot_stats": (
+            with_analytics,
+            in_unit_of_work(snapshot_stats),
+        ),
+        "main.write_dataframe": (with_stats, in_unit_of_work(dataframe)),
+        "main.write_histogram_cube": (with_stats, in_unit_of_work(histogram_cube)),
+        "main.write_daily_rollups": (with_stats, in_unit_of_work(daily_rollups)),
+        "main.write_archetype_analytics": (
+            with_snapshot,
+            in_unit_of_work(write_archetype_analytics),
+        ),
+    }
+
+
+def get_rss():
+    """Returns the resident memory of this process in bytes"""
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def reset_peak_rss():
+    """Lowers the peak resident memory to the current one, where Linux allows"""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def run_case(setup, function, repeat):
+    """
+    Returns best wall time, rows produced, peak traced memory and peak
+    resident memory growth in bytes of a case, the memory its setup and
+    the parent process hold excluded
+    """
+    timings, rss = [], 0
+    for _ in range(repeat):
+        arguments = setup()
+
+        # Forked processes start from the resident memory of their parent
+        reset_peak_rss()
+        resident = get_rss()
+
+        start = perf_counter()
+        rows = function(*arguments)
+        timings.append(perf_counter() - start)
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        rss = max(rss, peak - resident)
+
+    # Tracing slows the case down, so memory is measured by one more run
+    arguments = setup()
+    tracemalloc.start()
+    function(*arguments)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return min(timings), rows, peak, rss
+
+
+def measure_case(setup, function, repeat):
+    """Runs a case in a forked process, so it doesn't share caches with others"""
+    receiver, sender = Pipe(duplex=False)
+
+    def target():
+        try:
+            with redirect_stdout(io.StringIO()):
+                sender.send(run_case(setup, function, repeat))
+        except Exception as error:  # pylint: disable=W0703
+            sender.send(error)
+
+    process = get_context("fork").Process(target=target)
+    process.start()
+    result = receiver.recv()
+    process.join()
+
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Returns the cases slower or hungrier than the baseline by 'threshold' %"""
+    regressions = []
+    for name, (seconds, _, peak, _) in results.items():
+        if name not in baseline:
+            continue
+        base_seconds, _, base_peak, *_ = baseline[name]
+        for metric, current, base in zip(
+            ["time", "memory"], [seconds, peak], [base_seconds, base_peak]
+        ):
+            change = (current / base - 1) * 100 if base else 0
+            if change > threshold:
+                regressions.append(f"{name} {metric} {change:+.0f}%")
+    return regressions
+
+
+def run_suite(arguments):
+    """Measures every case of each fixtures directory against the baseline"""
+    path = Path(arguments.baseline)
+    baseline = json.loads(path.read_text()) if path.exists() else {}
+
+    results = {}
+    with TemporaryDirectory() as directory:
+        database_url = arguments.database or f"sqlite:///{directory}/benchmark.db"
+
+        for fixtures in arguments.fixtures:
+            set_mode("replay", fixtures)
+            cases = {
+                **get_fetch_cases(),
+                **get_transform_cases(),
+                **get_load_cases(database_url),
+            }
+
+            print(f"Fixtures '{fixtures}'")
+            for name, (setup, function) in cases.items():
+                if not re.search(arguments.cases, name):
+                    continue
+
+                key = f"{Path(fixtures).name}/{name}"
+                seconds, rows, peak, rss = measure_case(
+                    setup, function, arguments.repeat
+                )
+                results[key] = seconds, rows, peak, rss
+
+                change = ""
+                if key in baseline:
+                    change = f"{(seconds / baseline[key][0] - 1) * 100:+6.0f}%"
+                print(
+                    f"{name:>40}: {seconds * 1000:9.1f} ms {rows:9d} rows "
+                    f"{rows / seconds if seconds else 0:11.0f} rows/s "
+                    f"{peak / 2**20:8.1f} MiB peak {rss / 2**20:8.1f} MiB RSS "
+                    f"{change}"
+                )
+
+    if arguments.save:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({**baseline, **results}, indent=2))
+        print(f"Saved baseline to '{path}'")
+        return
+
+    regressions = compare(results, baseline, arguments.threshold)
+    if regressions:
+        print(f"Regressions above {arguments.threshold}%:", *regressions, sep="\n  ")
+        sys.exit(1)
+
+
+def latest_recording():
+    """Returns the most recently cached analytics payload"""
+    recordings = sorted(
+        Path(CACHE.directory).glob("analytics-*.json"), key=lambda p: p.stat().st_mtime
+    )
+    if not recordings:
+        raise SystemExit("No recorded analytics payload, pass one explicitly")
+    return recordings[-1]
+
+
+def run_comparison(arguments):
+    """Compares the original and vectorized analytics transforms on a payload"""
+    path = arguments.payload or latest_recording()
+    with open(path, "rb") as file:
+        payload = json.load(file)
+
+    raw = (
+        pd.json_normalize(payload["metadata"]["games"]).T,
+        pd.json_normalize(payload["data"]).T,
+    )
+    print(f"Payload '{path}' with {len(raw[1])} statistics keys")
+
+    results = {
+        name: measure(function, *raw, repeat=arguments.repeat)
+        for name, function in [("before", before), ("after", after)]
+    }
+    for name, (seconds, peak) in results.items():
+        print(f"{name:>6}: {seconds * 1000:9.1f} ms {peak / 2**20:9.1f} MiB peak")
+    print(f"speedup: {results['before'][0] / results['after'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(required=True)
+
+    suite = subparsers.add_parser("suite", help="benchmark every stage")
+    suite.add_argument(
+        "fixtures", nargs="+", help="recorded or synthetic fixtures directories"
+    )
+    suite.add_argument(
+        "--database", help="database URL whose tables are dropped, SQLite by default"
+    )
+    suite.add_argument("--cases", default="", help="regular expression of cases")
+    suite.add_argument("--baseline", default=BASELINE)
+    suite.add_argument("--threshold", type=float, default=THRESHOLD, help="in %%")
+    suite.add_argument("--save", action="store_true", help="store as the baseline")
+    suite.add_argument("--repeat", type=int, default=3)
+    suite.set_defaults(run=run_suite)
+
+    comparison = subparsers.add_parser("compare", help="compare analytics versions")
+    comparison.add_argument("payload", nargs="?", help="recorded analytics JSON")
+    comparison.add_argument("--repeat", type=int, default=5)
+    comparison.set_defaults(run=run_comparison)
+
+    arguments = parser.parse_args()
+    arguments.run(arguments)
@@ -0,0 +1,163 @@
+"""Disk backed cache of Untapped responses, revalidated through ETags"""
+
+from fcntl import LOCK_EX, flock
+from hashlib import blake2b
+from pathlib import Path
+from tempfile import mkstemp
+from threading import Lock
+from time import time
+import json
+import os
+
+
+# Cache location and size cap can be tuned through environment variables
+CACHE_DIR = os.getenv("UNTAPPED_CACHE_DIR", ".cache/untapped")
+CACHE_SIZE = int(os.getenv("UNTAPPED_CACHE_SIZE", str(512 * 2**20)))
+
+# Size of the chunks written to disk while downloading
+CHUNK_SIZE = 2**20
+
+
+class ResponseCache:
+    """
+    Stores response bodies along with their ETag and Last-Modified headers,
+    evicting the least recently used entries once the size cap is exceeded
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_SIZE):
+        self.refresh = False  # When set, stored validators are never sent
+        self.lock = Lock()
+        self.relocate(directory, max_bytes)
+
+    def relocate(self, directory, max_bytes=CACHE_SIZE):
+        """Points the cache to another directory, reading its entries"""
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+        # The directory is created on the first write, not on import
+        self.index_path = self.directory / "index.json"
+        self.index = self.read_index()
+
+    @staticmethod
+    def key(keyword, format_id=""):
+        """Returns the cache key of an endpoint and format"""
+        return f"{keyword}-{format_id}" if format_id else keyword
+
+    def path(self, key):
+        """Returns the path of the stored body"""
+        return self.directory / f"{key}.json"
+
+    def read_index(self):
+        """Reads entries metadata, discarding entries without a body"""
+        try:
+            index = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            return {}
+        return {key: entry for key, entry in index.items() if self.path(key).exists()}
+
+    def write_index(self):
+        """
+        Atomically persists entries metadata, merged with the entries other
+        processes persisted meanwhile, the most recently used one winning
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / "index.lock", "w") as lock:
+            flock(lock, LOCK_EX)  # Forked workers take turns
+
+            for key, entry in self.read_index().items():
+                if entry["accessed"] > self.index.get(key, entry)["accessed"]:
+                    self.index[key] = entry
+                else:
+                    self.index.setdefault(key, entry)
+
+            # Each writer has its own temporary file, replacing the index at once
+            descriptor, temporary = mkstemp(".tmp", "index.", self.directory)
+            try:
+                with os.fdopen(descriptor, "w") as file:
+                    file.write(json.dumps(self.index))
+                os.replace(temporary, self.index_path)
+            finally:
+                Path(temporary).unlink(missing_ok=True)
+
+    def validators(self, key):
+        """Returns the conditional request headers for a stored entry"""
+        entry = self.index.get(key)
+        if self.refresh or entry is None:
+            return {}
+
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def fingerprint(self, key):
+        """
+        Returns what identifies a stored body, changing whenever
+        a different body is stored under the same key
+        """
+        entry = self.index[key]
+        return (
+            entry.get("digest"),
+            entry["etag"],
+            entry["last_modified"],
+            entry["size"],
+        )
+
+    def open(self, key):
+        """Opens a stored body for reading and marks it as recently used"""
+        with self.lock:
+            self.index[key]["accessed"] = time()
+            self.write_index()
+        return open(self.path(key), "rb")
+
+    def store(self, key, chunks, etag=None, last_modified=None):
+        """
+        Writes a body from an iterable of chunks and records its headers
+        and content digest, returning its size in bytes
+        """
+        temporary = self.path(key).with_suffix(".part")
+        size, digest = 0, blake2b(digest_size=16)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(temporary, "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        os.replace(temporary, self.path(key))
+
+        with self.lock:
+            self.index[key] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "size": size,
+                "digest": digest.hexdigest(),
+                "accessed": time(),
+            }
+            self.evict(keep=key)
+            self.write_index()
+
+        return size
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the size cap is met"""
+        total = sum(entry["size"] for entry in self.index.values())
+        by_access = sorted(self.index.items(), key=lambda item: item[1]["accessed"])
+
+        for key, entry in by_access:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            self.path(key).unlink(missing_ok=True)
+            del self.index[key]
+            total -= entry["size"]
+
+    def clear(self):
+        """Removes every stored entry"""
+        with self.lock:
+            for key in self.index:
+                self.path(key).unlink(missing_ok=True)
+            self.index = {}
+            self.write_index()
@@ -3,9 +3,131 @@
 import pandas as pd
 import numpy as np
 
-from raw import request_cards, request_text, request_active
+from instrument import instrument
+from raw import fingerprint, request_cards, request_text, request_active
+from schema import apply_schema
+
+
+# Bits of the five bit WUBRG color mask
+COLOR_BITS = {"White": 1, "Blue": 2, "Black": 4, "Red": 8, "Green": 16}
+
+# Names of every color mask
+COLOR_IDENTITIES = {
+    0: "Colorless",
+    1: "White",
+    2: "Blue",
+    4: "Black",
+    8: "Red",
+    16: "Green",
+    3: "Azorius",
+    9: "Boros",
+    6: "Dimir",
+    20: "Golgari",
+    24: "Gruul",
+    10: "Izzet",
+    5: "Orzhov",
+    12: "Rakdos",
+    17: "Selesnya",
+    18: "Simic",
+    21: "Abzan",
+    19: "Bant",
+    7: "Esper",
+    14: "Grixis",
+    11: "Jeskai",
+    28: "Jund",
+    13: "Mardu",
+    25: "Naya",
+    22: "Sultai",
+    26: "Temur",
+    29: "Dune",
+    30: "Glint",
+    27: "Ink",
+    23: "Witch",
+    15: "Yore",
+    31: "Rainbow",
+}
+
+# Localization built from the latest text body, kept between daemon runs
+LOCALIZATION = {}
+
+# Dictionary table of the texts referenced by each card table, the
+# text column sharing its name and the referencing column adding '_id'
+TEXT_TABLES = {
+    "card_type": "type",
+    "card_subtype": "subtype",
+    "card_ability": "ability",
+}
+
+
+def check_text_ids(ids, texts):
+    """Raises when different texts share an id, as one would overwrite the other"""
+    pairs = pd.DataFrame(
+        {"id": np.asarray(ids), "text": np.asarray(texts, dtype=object)}
+    )
+    pairs = pairs.drop_duplicates()
+    shared = pairs[pairs.id.duplicated(keep=False)]
+    if len(shared):
+        raise ValueError(
+            f"Texts {sorted(shared.text)} share the ids {sorted(set(shared.id))}"
+        )
+
+
+def get_fallback_ids(texts):
+    """
+    Returns stable negative ids of texts without a text id of their own,
+    such as single words of a type line, from the 63 high bits of their hash
+    """
+    hashes = pd.util.hash_array(np.asarray(texts, dtype=object))
+    ids = -(hashes >> np.uint64(1)).astype(np.int64) - 1
+
+    check_text_ids(ids, texts)
+    return ids
+
+
+class Localization:
+    """Text ids sorted alongside their texts, translated in batches"""
+
+    def __init__(self, raw_text):
+        # Keep the first text of repeated ids, as '.loc[x].values[0]' did
+        text = raw_text.text[~raw_text.index.duplicated()].sort_index()
+        self.ids = text.index.to_numpy(dtype=np.int64)
+        self.texts = text.to_numpy(dtype=object)
+
+        # Texts repeated under several ids are interned as the smallest one
+        self.text_ids = pd.Series(self.ids, index=self.texts)
+        self.text_ids = self.text_ids[~self.text_ids.index.duplicated()]
+
+    def translate(self, ids):
+        """Returns the texts of a series of ids, NaN when missing"""
+        ids = pd.Series(ids)
+        texts = pd.Series(np.nan, index=ids.index, dtype=object)
+
+        known = ids.notna().to_numpy()
+        keys = ids[known].to_numpy(dtype=np.int64)
+        positions = np.searchsorted(self.ids, keys).clip(max=len(self.ids) - 1)
+        found = self.ids[positions] == keys
+
+        texts.iloc[np.flatnonzero(known)[found]] = self.texts[positions[found]]
+        return texts
+
+    def intern(self, texts):
+        """Returns the text id of a series of texts, NA when missing"""
+        ids = texts.map(self.text_ids).astype("Int64")
+
+        unknown = (ids.isna() & texts.notna()).to_numpy()
+        ids[unknown] = get_fallback_ids(texts[unknown])
+        return ids
+
+
+def get_localization():
+    """Returns the localization of the current texts, rebuilt only once they change"""
+    current = fingerprint("text")
+    if current is None or LOCALIZATION.get("fingerprint") != current:
+        LOCALIZATION.update(fingerprint=current, index=Localization(request_text()))
+    return LOCALIZATION["index"]
 
 
+@instrument
 def filter_raw_card(raw_card):
     """
     Change naming conventions and keep only
@@ -40,17 +162,19 @@ def filter_raw_card(raw_card):
     return raw_card.rename(rename, axis="columns").reset_index()[keep]
 
 
-def get_card_dataframe(filtered_df, raw_text):
+@instrument
+def get_card_dataframe(filtered_df, localization):
     """Returns card dataframe"""
 
     # Card columns mappable to text
     id_to_text = ["titleId", "flavorId", "cardTypeTextId", "subtypeTextId"]
 
     # Additional text_columns columns
-    filtered_df = filtered_df.join(
-        filtered_df[id_to_text]
-        .applymap(lambda x: raw_text.loc[x].values[0], na_action="ignore")
-        .rename(columns={column: column[:-2] for column in id_to_text})
+    filtered_df = filtered_df.assign(
+        **{
+            column[:-2]: localization.translate(filtered_df[column])
+            for column in id_to_text
+        }
     )
 
     # Only tracked supertype will be 'legendary'
@@ -93,21 +217,18 @@ def get_card_dataframe(filtered_df, raw_text):
         "is_rebalanced",
     ]
 
-    return filtered_df[order]
+    return apply_schema("card", filtered_df[order])
 
 
-def get_card_type(filtered_df, raw_text):
+@instrument
+def get_card_type(filtered_df, localization):
     """Returns card type data frame"""
     # Convert 'cardTypeTextId' to text
-    filtered_df = filtered_df.join(
-        filtered_df.cardTypeTextId.map(
-            lambda x: raw_text.loc[x].values[0], na_action="ignore"
-        ).rename("type")
-    )
+    types = localization.translate(filtered_df.cardTypeTextId).rename("type")
 
     # Split the text and transform it into a list of rows,
     # deleting the ones without information
-    filtered_df = filtered_df.type.str.split().explode().dropna()
+    filtered_df = types.str.split().explode().dropna()
 
     # There are special cases of cards not having types
     # such as cards 'Day' and 'Night'
@@ -115,27 +236,32 @@ def get_card_type(filtered_df, raw_text):
         ~filtered_df.isin(["NONE", "Legendary", "Basic", "Token"])
     ]
 
-    return filtered_df.to_frame()
+    card_type = filtered_df.to_frame().assign(type_id=localization.intern(filtered_df))
+    return apply_schema("type", apply_schema("card_type", card_type))
 
 
-def get_card_subtype(filtered_df, raw_text):
+@instrument
+def get_card_subtype(filtered_df, localization):
     """Returns card subtype data frame"""
     # Convert 'subtypeTextId' to text
-    filtered_df = filtered_df.join(
-        filtered_df.subtypeTextId.map(
-            lambda x: (raw_text.loc[x].values[0]), na_action="ignore"
-        ).rename("subtype")
-    )
+    subtypes = localization.translate(filtered_df.subtypeTextId).rename("subtype")
 
     # Split the text and transform it into a list of rows,
     # deleting the ones without information
-    filtered_df = filtered_df.subtype.str.split().explode().dropna()
+    filtered_df = subtypes.str.split().explode().dropna()
 
-    return filtered_df.to_frame()
+    card_subtype = filtered_df.to_frame().assign(
+        subtype_id=localization.intern(filtered_df)
+    )
+    return apply_schema("subtype", apply_schema("card_subtype", card_subtype))
 
 
+@instrument
 def get_card_cost(filtered_df):
-    """Returns card cost data frame"""
+    """
+    Returns card cost data frame, along with the WUBRG
+    color mask and mana value of each card
+    """
     # Casting color codes in 'castingcost' column
     casting_colors = {
         "Black": r"oB",
@@ -154,6 +280,15 @@ def get_card_cost(filtered_df):
     # Special case is colorless that can be any number
     filtered_df["Colorless"] = filtered_df.castingcost.str.extract(r"(\d+)")
 
+    # Mask of the colors present and mana value, which ignores 'X'
+    color = pd.DataFrame(index=filtered_df.index)
+    color["color_mask"] = sum(
+        (filtered_df[name] > 0) * bit for name, bit in COLOR_BITS.items()
+    )
+    color["cmc"] = filtered_df[list(COLOR_BITS) + ["Multicolor"]].sum(axis=1) + (
+        pd.to_numeric(filtered_df.Colorless).fillna(0).astype(int)
+    )
+
     # Stack columns into rows and set index to card_id only
     columns = ["Colorless"] + list(casting_colors.keys())
     filtered_df = (
@@ -167,30 +302,50 @@ def get_card_cost(filtered_df):
     filtered_df.cost = pd.to_numeric(filtered_df.cost)  # Convert from string to number
 
     # Only record costs above zero
-    return filtered_df[filtered_df.cost > 0]
+    card_cost = apply_schema("card_cost", filtered_df[filtered_df.cost > 0])
+    return card_cost, apply_schema("card", color)
 
 
-def get_card_ability(filtered_df, raw_text):
+@instrument
+def get_card_ability(filtered_df, localization):
     """Returns card_ability data frame"""
-    filtered_df = (
-        filtered_df.ability.dropna()
-        .explode()
-        .apply(lambda x: x.get("TextId"))
-        .map(lambda x: raw_text.loc[x].values[0])
+    text_ids = filtered_df.ability.dropna().explode().dropna().str.get("TextId")
+    abilities = localization.translate(text_ids).rename("ability")
+
+    card_ability = abilities.to_frame().assign(
+        ability_id=localization.intern(abilities)
     )
-    return filtered_df.to_frame()
+    return apply_schema("ability", apply_schema("card_ability", card_ability))
+
+
+@instrument
+def get_card_hashes(card, *children):
+    """
+    Returns a hexadecimal content hash per card, covering its row and
+    the rows of its children regardless of their order
+    """
+    hashes = pd.DataFrame({"card": pd.util.hash_pandas_object(card)})
+
+    # Row hashes wrap around when summed, keeping each child set order free
+    for child in children:
+        rows = pd.util.hash_pandas_object(child)
+        hashes[child.name] = rows.groupby(level=0).sum()
 
+    hashes = hashes.fillna(0).astype(np.uint64)
+    return pd.util.hash_pandas_object(hashes, index=False).map("{:016x}".format)
 
+
+@instrument
 def get_card_information(sets):
     """
     Returns multiple data frames containing card
     information after normalization
     """
     raw_card = request_cards(sets)
-    raw_text = request_text()
+    localization = get_localization()
 
     filtered = filter_raw_card(raw_card)
-    card = get_card_dataframe(filtered, raw_text)
+    card = get_card_dataframe(filtered, localization)
 
     # Rename 'titleId' to 'card_id' and promote it to index
     for dataframe in [filtered, card]:
@@ -200,10 +355,13 @@ def get_card_information(sets):
     filtered.index.name = "card_id"
     card.index.name = "id"
 
-    card_type = get_card_type(filtered, raw_text)
-    card_subtype = get_card_subtype(filtered, raw_text)
-    card_cost = get_card_cost(filtered)
-    card_ability = get_card_ability(filtered, raw_text)
+    card_type = get_card_type(filtered, localization)
+    card_subtype = get_card_subtype(filtered, localization)
+    card_cost, card_color = get_card_cost(filtered)
+    card_ability = get_card_ability(filtered, localization)
+
+    # Color mask and mana value are stored along the card
+    card = card.join(card_color)
 
     # Set names:
     card.name = "card"
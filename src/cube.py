@@ -0,0 +1,82 @@
+"""Win rate histogram cube of a snapshot, read by the histogram panels"""
+
+import numpy as np
+import pandas as pd
+
+from instrument import instrument
+from schema import apply_schema
+
+
+# Panels filtering on games use the largest threshold below their value
+GAMES_THRESHOLDS = [0, 100, 1000, 10000]
+
+# Win rates are bucketed in 5% bins, a perfect win rate having its own
+BINS = 20
+
+# Card attributes the panels filter on, along with tier, type and games
+ATTRIBUTES = ["set_id", "rarity", "is_legendary", "cmc", "color_mask"]
+
+# Every dimension of the cube, in the order cells are numbered
+DIMENSIONS = ["games_min", "tier", "type", *ATTRIBUTES, "bin"]
+
+
+def get_win_rates(stats, threshold):
+    """
+    Returns the win rate of each card per tier and over all tiers, counting
+    only the tiers where the card reached 'threshold' games
+    """
+    rows = stats.loc[stats.games >= threshold, ["card_id", "tier", "games", "wins"]]
+    rows = rows.astype({"tier": str})
+
+    # Pooled tiers are summed before dividing, like the panels do without a tier
+    pooled = rows.groupby("card_id", as_index=False)[["games", "wins"]].sum()
+    rates = pd.concat([rows, pooled.assign(tier="ALL")], ignore_index=True)
+    rates = rates[rates.games > 0]
+
+    return rates[["card_id", "tier"]].assign(winrate=rates.wins / rates.games)
+
+
+@instrument
+def get_histogram_cube(stats):
+    """
+    Returns the number of cards in each win rate bin for every combination
+    of the histogram filters, 'ALL' standing for an unfiltered tier or type
+    """
+    attributes = stats.groupby("card_id")[["types", *ATTRIBUTES]].first()
+
+    # Cards count once towards each of their types, and once towards all types
+    types = attributes.types.str.split(",").explode().dropna()
+    types = pd.concat([types, pd.Series("ALL", index=attributes.index)])
+    types = types.rename("type").rename_axis("card_id").reset_index()
+
+    cells = pd.concat(
+        [
+            get_win_rates(stats, threshold).assign(games_min=threshold)
+            for threshold in GAMES_THRESHOLDS
+        ],
+        ignore_index=True,
+    )
+    cells = cells.merge(types, on="card_id").join(attributes[ATTRIBUTES], on="card_id")
+    cells["bin"] = np.floor(cells.winrate.to_numpy() * BINS).astype(int)
+
+    # Cells are numbered from the codes of their dimensions and counted at once
+    codes, uniques = zip(
+        *(pd.factorize(cells[name], use_na_sentinel=False) for name in DIMENSIONS)
+    )
+    sizes = [len(values) for values in uniques]
+    numbers, inverse = np.unique(
+        np.ravel_multi_index(codes, sizes), return_inverse=True
+    )
+    counts = np.bincount(inverse)
+
+    cube = pd.DataFrame(
+        {
+            name: np.asarray(values, dtype=object)[positions]
+            for name, values, positions in zip(
+                DIMENSIONS, uniques, np.unravel_index(numbers, sizes)
+            )
+        }
+    )
+    cube["cards"] = counts
+
+    return apply_schema("win_rate_histogram_cube", cube)
@@ -0,0 +1,90 @@
+"""Pooled database engine and the transactional unit of work of a run"""
+
+from contextlib import contextmanager
+from weakref import WeakSet
+import os
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.orm import Session
+from sqlalchemy_utils import create_database, database_exists
+
+
+# Pool sizing can be tuned through environment variables. Connections are
+# checked before use and recycled before RDS closes idle ones on its side
+POOL_SIZE = int(os.getenv("UNTAPPED_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("UNTAPPED_POOL_MAX_OVERFLOW", "10"))
+POOL_RECYCLE = int(os.getenv("UNTAPPED_POOL_RECYCLE", "3600"))
+POOL_PRE_PING = os.getenv("UNTAPPED_POOL_PRE_PING", "1") != "0"
+
+# Engines created by this process, whose connections forked workers drop
+ENGINES = WeakSet()
+
+
+def get_url():
+    """
+    Returns the database URL, using environment variables.
+    'DATABASE_URL' takes precedence, e.g. 'sqlite:///untapped.db' for local runs
+    """
+    if os.getenv("DATABASE_URL"):
+        return make_url(os.getenv("DATABASE_URL"))
+
+    port = os.getenv("MYSQL_PORT")
+    return URL.create(
+        drivername="mysql+pymysql",
+        host=os.getenv("MYSQL_HOST"),
+        port=int(port) if port else None,
+        username=os.getenv("MYSQL_USER"),
+        password=os.getenv("MYSQL_PASSWORD"),
+        database=os.getenv("MYSQL_DATABASE"),
+    )
+
+
+def get_engine(url=None):
+    """Creates a pooled engine, for the configured database unless given a URL"""
+    url = make_url(url) if url is not None else get_url()
+
+    # SQLite files are local, so only server connections are pooled
+    options = {}
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            pool_size=POOL_SIZE,
+            max_overflow=POOL_MAX_OVERFLOW,
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=POOL_PRE_PING,
+        )
+    if url.get_backend_name() == "mysql":
+        # Allow bulk writes through LOAD DATA LOCAL INFILE
+        options["connect_args"] = {"local_infile": True}
+
+    engine = create_engine(url, **options)
+    ENGINES.add(engine)
+    return engine
+
+
+def release_inherited_connections():
+    """
+    Drops the pooled connections a forked process inherited without
+    closing them, as they still belong to the parent process
+    """
+    for engine in list(ENGINES):
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=release_inherited_connections)
+
+
+def garantee_database(eng):
+    """Creates a database if one doesn't exist already"""
+    if not database_exists(eng.url):
+        create_database(eng.url)
+
+
+@contextmanager
+def unit_of_work(engine):
+    """
+    Yields a session whose writes are committed once when the block ends,
+    or rolled back as a whole when it raises, closing it either way
+    """
+    with Session(engine) as session, session.begin():
+        yield session
@@ -0,0 +1,76 @@
+"""Denormalized card statistics replacing the 'final_model' query"""
+
+import pandas as pd
+from sqlalchemy import select
+
+from card import COLOR_IDENTITIES
+from instrument import instrument
+from models import CardType, Type
+from winrate import WIN_RATE_COLUMNS
+
+
+@instrument
+def read_card_information(connection):
+    """Reads the card tables needed by 'get_card_attributes'"""
+    card = pd.read_sql_table("card", connection, index_col="id")
+    card_type = pd.read_sql(
+        select(CardType.card_id, Type.type).join(Type, CardType.type_id == Type.id),
+        connection,
+        index_col="card_id",
+    )
+    card_cost = pd.read_sql_table(
+        "card_cost", connection, index_col="card_id", columns=["color", "cost"]
+    )
+    return card, card_type, card_cost
+
+
+@instrument
+def get_card_attributes(card, card_type, card_cost):
+    """Returns the dashboard attributes of each card"""
+    columns = ["art_link", "set_id", "title", "rarity", "power", "toughness"]
+    attributes = card[columns].copy()
+
+    legendary = card.is_legendary.fillna(False).astype(bool)
+    attributes["is_legendary"] = legendary.map({True: "Yes", False: "No"})
+
+    # Mana value and color identity were derived from the cost
+    attributes["cmc"] = card.cmc
+    attributes["color_mask"] = card.color_mask
+    attributes["color_identity"] = card.color_mask.map(COLOR_IDENTITIES)
+
+    # Colors ignore 'X' costs
+    costs = card_cost[card_cost.color != "X"]
+    attributes["colors"] = costs.groupby(level=0).color.agg(",".join)
+
+    attributes["types"] = card_type.groupby(level=0).type.agg(",".join)
+
+    return attributes
+
+
+@instrument
+def get_card_snapshot_stats(distinct_games, analytics_games, distribution, attributes):
+    """
+    Returns one row per card and tier of a snapshot, holding the
+    columns the 'final_model' query used to compute
+    """
+    # Played copies become one column per number of copies
+    copies = (
+        distribution.astype({"tier": str})
+        .pivot_table(
+            index=["card_id", "tier"], columns="copies", values="played", aggfunc="sum"
+        )
+        .reindex(columns=range(1, 5))
+        .rename(columns=lambda n: f"copies_{n}")
+    )
+
+    unique = distinct_games.astype({"tier": str}).set_index("tier").total
+    columns = ["card_id", "tier", "games", "wins", *WIN_RATE_COLUMNS]
+    stats = (
+        analytics_games.astype({"tier": str})[columns]
+        .join(unique.rename("unique"), on="tier")
+        .join(copies, on=["card_id", "tier"])
+        .join(attributes, on="card_id")
+    )
+    stats[copies.columns] = stats[copies.columns].fillna(0).astype(int)
+
+    return stats
@@ -0,0 +1,210 @@
+"""Per stage timing, memory and row count instrumentation of pipeline runs"""
+
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from resource import RUSAGE_SELF, getrusage
+from threading import Lock, local
+from time import perf_counter, process_time
+import json
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+# Stage figures can also be exported for the Prometheus textfile collector
+PROMETHEUS_FILE = os.getenv("UNTAPPED_PROMETHEUS_FILE")
+
+# Figures exported for each stage, with their Prometheus metric names
+METRICS = {
+    "wall_seconds": "untapped_stage_wall_seconds",
+    "cpu_seconds": "untapped_stage_cpu_seconds",
+    "rss_bytes": "untapped_stage_rss_growth_bytes",
+    "traced_bytes": "untapped_stage_traced_peak_bytes",
+    "downloaded_bytes": "untapped_stage_downloaded_bytes",
+    "rows_in": "untapped_stage_rows_in",
+    "rows_out": "untapped_stage_rows_out",
+}
+
+# Stages are only recorded while a run is active
+RUN = {}
+LOCK = Lock()
+
+# Each thread nests its own stages
+STACKS = local()
+
+
+def get_stack():
+    """Returns the stages currently open in this thread"""
+    if not hasattr(STACKS, "stages"):
+        STACKS.stages = []
+    return STACKS.stages
+
+
+def get_max_rss():
+    """Returns the process resident set size high-water mark, in bytes"""
+    return getrusage(RUSAGE_SELF).ru_maxrss * 1024  # Linux reports KiB
+
+
+def count_rows(value, top=True):
+    """
+    Returns the rows held by frames, arrays, columnar dictionaries, lists
+    and tuples of them, counting integers only as direct results
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray, list)):
+        return len(value)
+    if isinstance(value, dict):
+        first = next(iter(value.values()), None)
+        return len(first) if isinstance(first, np.ndarray) else len(value)
+    if isinstance(value, tuple):
+        return sum(count_rows(item, top=False) for item in value)
+    if top and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return 0
+
+
+def start_run(sink=None):
+    """Starts recording stages, writing each one as a JSON line to 'sink'"""
+    with LOCK:
+        RUN.clear()
+        RUN.update(stages=[], sink=sink)
+
+
+def finish_run():
+    """Stops recording, returning the stages of the run as a data frame"""
+    with LOCK:
+        stages = pd.DataFrame(
+            RUN.get("stages", []), columns=["stage", "parent", *METRICS]
+        )
+        RUN.clear()
+
+    if PROMETHEUS_FILE:
+        write_prometheus(PROMETHEUS_FILE, stages)
+
+    return stages
+
+
+def add_downloaded_bytes(size):
+    """Adds downloaded bytes to every stage open in this thread"""
+    for record in get_stack():
+        record["downloaded_bytes"] += size
+
+
+@contextmanager
+def stage(name, rows_in=0):
+    """
+    Records a block as a stage of the active run, yielding its record
+    so the block can fill the rows it produced
+    """
+    if not RUN:
+        yield {}
+        return
+
+    stack = get_stack()
+    record = {
+        "stage": name,
+        "parent": stack[-1]["stage"] if stack else None,
+        **dict.fromkeys(METRICS, 0),
+        "rows_in": rows_in,
+    }
+
+    # Traced peaks are reset per stage, so enclosing stages keep theirs aside
+    traced_start = 0
+    if tracemalloc.is_tracing():
+        traced_start, peak = tracemalloc.get_traced_memory()
+        for parent in stack:
+            parent["peak"] = max(parent.get("peak", 0), peak)
+        tracemalloc.reset_peak()
+
+    stack.append(record)
+    rss_start, wall_start, cpu_start = get_max_rss(), perf_counter(), process_time()
+    try:
+        yield record
+    finally:
+        record["wall_seconds"] = perf_counter() - wall_start
+        record["cpu_seconds"] = process_time() - cpu_start
+        record["rss_bytes"] = get_max_rss() - rss_start
+        stack.pop()
+
+        if tracemalloc.is_tracing():
+            peak = max(record.pop("peak", 0), tracemalloc.get_traced_memory()[1])
+            record["traced_bytes"] = peak - traced_start
+            for parent in stack:
+                parent["peak"] = max(parent.get("peak", 0), peak)
+
+        emit(record)
+
+
+def emit(record):
+    """Appends a finished stage to the run and writes it as a JSON line"""
+    with LOCK:
+        if not RUN:
+            return
+        RUN["stages"].append(record)
+        if RUN["sink"] is not None:
+            print(json.dumps(record), file=RUN["sink"], flush=True)
+
+
+def call_in_worker(function, *args):
+    """
+    Calls a function in a forked worker process, returning its result along
+    with the stages it recorded, which the parent adds through 'merge_stages'
+    """
+    # The copies of the parent stages and sink are left to the parent
+    with LOCK:
+        if RUN:
+            RUN.update(stages=[], sink=None)
+
+    result = function(*args)
+
+    with LOCK:
+        return result, RUN.get("stages", [])
+
+
+def merge_stages(stages):
+    """Adds the stages recorded by a worker process to the active run"""
+    for record in stages:
+        emit(record)
+
+
+def instrument(function):
+    """Records every call of a function as a stage, counting its rows"""
+
+    # Scripts are named after their file rather than '__main__'
+    module = function.__module__
+    if module == "__main__":
+        module = Path(sys.modules[module].__file__).stem
+    name = f"{module}.{function.__qualname__}"
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not RUN:
+            return function(*args, **kwargs)
+
+        with stage(name, count_rows(args, top=False)) as record:
+            result = function(*args, **kwargs)
+            record["rows_out"] = count_rows(result)
+        return result
+
+    return wrapper
+
+
+def write_prometheus(path, stages):
+    """Atomically writes stage totals in the Prometheus text format"""
+    totals = stages.groupby("stage")[list(METRICS)].sum()
+
+    lines = []
+    for column, metric in METRICS.items():
+        lines.append(f"# TYPE {metric} gauge")
+        lines.extend(
+            f'{metric}{{stage="{name}"}} {value}'
+            for name, value in totals[column].items()
+        )
+
+    partial = f"{path}.partial"
+    with open(partial, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+    os.replace(partial, path)
@@ -0,0 +1,83 @@
+"""Incremental JSON reader that walks large objects one member at a time"""
+
+import codecs
+import json
+
+
+class JsonStream:
+    """
+    Reads JSON from a binary file without loading the whole document.
+    Objects are walked with 'items', which yields each key and expects
+    the caller to consume its value through 'value' or a nested 'items'
+    before asking for the next key.
+    """
+
+    def __init__(self, file, chunk_size=2**20):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+
+    def fill(self):
+        """Appends the next chunk to the unread buffer, False when exhausted"""
+        chunk = self.file.read(self.chunk_size)
+        self.buffer = self.buffer[self.position :] + self.utf8.decode(
+            chunk, final=not chunk
+        )
+        self.position = 0
+        return bool(chunk)
+
+    def peek(self):
+        """Returns the next non whitespace character, empty at the end"""
+        while True:
+            while self.position < len(self.buffer):
+                if not self.buffer[self.position].isspace():
+                    return self.buffer[self.position]
+                self.position += 1
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        """Consumes the given structural character"""
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.position}")
+        self.position += 1
+
+    def value(self):
+        """Decodes the next complete value"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+
+            # A number touching the end of the buffer may still be incomplete,
+            # as may one stopped before a fraction or exponent yet unread
+            if self.buffer[end : end + 1] in ("", ".", "e", "E") and self.fill():
+                continue
+
+            self.position = end
+            return obj
+
+    def items(self):
+        """Yields the keys of the next object"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.position += 1
+            return
+
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+
+            if self.peek() == ",":
+                self.position += 1
+            else:
+                self.expect("}")
+                return
@@ -1,46 +1,77 @@
 """Controls order of writing to the database operation"""
 
+import argparse
 import os
+import sys
+import tracemalloc
 
-from sqlalchemy_utils import database_exists, create_database
-from sqlalchemy import create_engine, update
-from sqlalchemy.engine import URL
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import delete, insert, select, update
 from sqlalchemy.sql import func
 
+import numpy as np
 import pandas as pd
 
-from models import Set, AnalyticsGames, DistinctGames, create_all
-from analytics import get_analytics
-from card import get_card_information
-from raw import request_active
+from models import (
+    Archetype,
+    Base,
+    Card,
+    CardDailyStats,
+    PipelineRun,
+    Set,
+    Snapshot,
+    AnalyticsGames,
+    DistinctGames,
+    create_all,
+)
+from migrations import migrate
+from analytics import (
+    get_analytics,
+    get_analytics_by_format,
+    get_archetype_distinct_games,
+    get_archetype_games,
+)
+from archive import archive_cards, archive_run
+from card import (
+    TEXT_TABLES,
+    check_text_ids,
+    get_card_hashes,
+    get_card_information,
+)
+from cube import get_histogram_cube
+from database import garantee_database, get_engine, unit_of_work
+from instrument import finish_run, get_max_rss, instrument, stage, start_run
+from final_model import (
+    get_card_attributes,
+    get_card_snapshot_stats,
+    read_card_information,
+)
+from raw import (
+    CACHE,
+    EVENTS,
+    FIXTURES_DIR,
+    MODE,
+    MODES,
+    clear_requests,
+    fingerprint,
+    prefetch,
+    request_formats,
+    set_mode,
+    stream_archetypes,
+)
+from rollup import KEYS, MEASURES, get_attribute_rollup, get_card_rollup, merge_rollup
+from scheduler import SCHEDULE, Health, Schedule, run_forever, serve_health
+from winrate import WIN_RATE_COLUMNS, get_win_rate_stats
+from writer import bulk_update, bulk_write
 
 # pylint: disable=E1102
 
+# Bodies the sets and cards are built from, shared by every format
+INPUTS = ["active", "cards", "text"]
 
-def get_engine():
-    """Creates engine from URL, using environment variables"""
-    url = URL.create(
-        drivername="mysql+pymysql",
-        host=os.getenv("MYSQL_HOST"),
-        username=os.getenv("MYSQL_USER"),
-        password=os.getenv("MYSQL_PASSWORD"),
-        database=os.getenv("MYSQL_DATABASE"),
-    )
-    return create_engine(url)
-
-
-def garantee_database(eng):
-    """Creates a database if one doesn't exist already"""
-    if not database_exists(eng.url):
-        create_database(eng.url)
-
-
-def write_set(session):
-    """Write set table"""
-    # Get currently legal sets according to the website
-    format_id, active_sets = request_active()
 
+@instrument
+def write_set(session, active_sets):
+    """Write set table, given the sets currently legal according to the website"""
     # Get legal sets existing in the database
     existing_sets = (
         session.query(Set.id, Set.rotated_on).filter(Set.rotated_on.is_(None)).all()
@@ -54,7 +85,9 @@ def write_set(session):
     if new_sets:
         new_entities = [Set(id=set_id) for set_id in new_sets]
         session.add_all(new_entities)
-        session.commit()
+
+        # Cards are written through the connection, which doesn't autoflush
+        session.flush()
 
     # Rotate sets that are not an active according to website
     existing_ids_to_update = [s[0] for s in existing_sets if s[0] not in active_sets]
@@ -64,38 +97,106 @@ def write_set(session):
             .where(Set.id.in_(existing_ids_to_update))
             .values(rotated_on=func.now())
         )
-        session.commit()
 
-    return format_id, new_sets
+    return new_sets
+
+
+@instrument
+def write_card(connection, sets):
+    """
+    Synchronizes card related dataframes of legal sets with the database,
+    writing only the cards whose content hash changed along with their children
+    """
+    card_dataframes = get_card_information(sets)
+    card, *children = card_dataframes
+
+    # Compare hashes of legal cards against the stored ones
+    hashes = get_card_hashes(card, *children)
+    stored = pd.read_sql(
+        select(Card.id, Card.content_hash), connection, index_col="id"
+    ).content_hash
+    changed = hashes[hashes != stored.reindex(hashes.index)]
+
+    if changed.empty:
+        print("No card was changed")
+        return card_dataframes
+
+    updated = changed.index.intersection(stored.index)
+    rows = card.loc[changed.index].assign(content_hash=changed)
+    bulk_write(connection, card.name, rows.drop(updated), index=True)
+    bulk_update(connection, card.name, rows.loc[updated], index=True)
+
+    # Children of updated cards are replaced as a whole
+    for child in children:
+        child_table = Base.metadata.tables[child.name]
+        connection.execute(
+            delete(child_table).where(child_table.c.card_id.in_(updated.tolist()))
+        )
 
+        rows = child[child.index.isin(changed.index)]
+        if child.name in TEXT_TABLES:
+            # Texts are written once to their dictionary, rows keep their ids
+            name = TEXT_TABLES[child.name]
+            write_texts(connection, child_table, name, rows)
+            rows = rows.drop(columns=name)
+        bulk_write(connection, child.name, rows, index=True)
+
+    return card_dataframes
+
+
+def write_texts(connection, child_table, name, rows):
+    """
+    Inserts the texts of rows missing from a dictionary table, once
+    the texts no card references anymore are removed from it
+    """
+    texts = (
+        rows[[f"{name}_id", name]]
+        .dropna()
+        .drop_duplicates()
+        .rename(columns={f"{name}_id": "id"})
+    )
+    check_text_ids(texts.id, texts[name])
 
-def write_card(connection):
-    """Writes all card related dataframes to database"""
-    card_dataframes = get_card_information(request_active()[1])
+    dictionary = Base.metadata.tables[name]
+    referenced = select(child_table.c[f"{name}_id"]).where(
+        child_table.c[f"{name}_id"].is_not(None)
+    )
+    connection.execute(delete(dictionary).where(dictionary.c.id.not_in(referenced)))
+
+    stored = pd.read_sql(
+        select(dictionary.c.id, dictionary.c[name]), connection, index_col="id"
+    )[name]
+    known = texts[texts.id.isin(stored.index)]
+    changed = known[known[name].to_numpy(dtype=object) != stored[known.id].to_numpy()]
+
+    # Fallback ids derive from their text, so only a collision changes it,
+    # whereas the text of an Untapped id can be reworded
+    collided = changed[changed.id < 0]
+    if len(collided):
+        raise ValueError(
+            f"Texts {sorted(collided[name])} collide with stored fallback ids"
+        )
+    if len(changed):
+        bulk_update(connection, name, changed)
 
-    for card_df in card_dataframes:
-        affected = card_df.to_sql(name=card_df.name, con=connection, if_exists="append")
-        print(f"Table '{card_df.name}' had {affected} new inclusions")
+    missing = texts[~texts.id.isin(stored.index)]
+    if len(missing):
+        bulk_write(connection, name, missing)
 
 
 def write_dataframe(session, tablename, dataframe, index=False, index_label=None):
-    """Write generic analytics dataframe"""
-    affected = dataframe.to_sql(
-        tablename,
-        con=session.get_bind(),
-        if_exists="append",
-        index=index,
-        index_label=index_label,
-    )
-    session.commit()  # Garantee that database is ready to be queried
-    print(f"Table '{tablename}' had {affected} new inclusions")
+    """Write generic analytics dataframe within the session transaction"""
+    bulk_write(session.connection(), tablename, dataframe, index, index_label)
 
 
-def retrieve_latest(session, table):
-    """Retrieve records written on the previous step"""
-    latest = session.query(func.max(table.created_on)).scalar()
-    query = session.query(table).filter(table.created_on == latest)
-    return pd.read_sql(query.statement, con=session.get_bind())
+def reserve_ids(session, table, count):
+    """
+    Returns the next 'count' primary keys of a table, locking its
+    latest row so ids can be assigned before inserting
+    """
+    latest = session.execute(select(func.max(table.id)).with_for_update()).scalar()
+    first = (latest or 0) + 1
+    return np.arange(first, first + count)
 
 
 def merge_dataframe(left, right, merging_columns, renamed):
@@ -108,62 +209,409 @@ def merge_dataframe(left, right, merging_columns, renamed):
     return merged.sort_values(merging_columns)
 
 
-def write_analytics(session, format_id):
-    """Writes both analytics related dataframes to database"""
-    distinct_games, analytics_games, analytics_distribution = get_analytics(format_id)
+def read_previous_day(session, snapshot_id):
+    """
+    Returns the win rate and popularity of each card and tier on the
+    latest day before a snapshot's with a rollup of the same format
+    """
+    taken_at, format_id = session.execute(
+        select(Snapshot.taken_at, Snapshot.format_id).where(Snapshot.id == snapshot_id)
+    ).one()
 
-    # Write 'distinct_games' DataFrame to the 'DistinctGames' table
-    write_dataframe(session, "distinct_games", distinct_games, True, "tier")
+    day = session.execute(
+        select(func.max(CardDailyStats.day)).where(
+            CardDailyStats.format_id == format_id,
+            CardDailyStats.day < taken_at.date(),
+        )
+    ).scalar()
+    if day is None:
+        return None
+
+    previous = pd.read_sql(
+        select(
+            CardDailyStats.card_id,
+            CardDailyStats.tier,
+            CardDailyStats.games,
+            CardDailyStats.wins,
+            CardDailyStats.total,
+        ).where(CardDailyStats.format_id == format_id, CardDailyStats.day == day),
+        session.connection(),
+        index_col=["card_id", "tier"],
+    ).astype(float)
+
+    return pd.DataFrame(
+        {
+            "winrate": previous.wins / previous.games,
+            "popularity": previous.games / previous.total,
+        }
+    )
 
-    # Retrieve records written on the previous step
-    latest_records = retrieve_latest(session, DistinctGames)
 
-    # Merge the query result with 'analytics_distribution'
-    merged_df = merge_dataframe(
-        analytics_games.reset_index(), latest_records, ["tier"], "distinct_id"
+@instrument
+def write_analytics(session, format_id, event=None, analytics=None):
+    """
+    Writes all analytics related dataframes of a format to database,
+    generating their ids client side instead of reading rows back
+    """
+    if analytics is None:
+        analytics = get_analytics(format_id)
+    distinct_games, analytics_games, analytics_distribution = analytics
+
+    # Every row of this ingestion belongs to the same snapshot
+    snapshot = Snapshot(format_id=int(format_id), event=event)
+    session.add(snapshot)
+    session.flush()
+
+    # Assign ids to 'distinct_games' rows
+    distinct_games = distinct_games.reset_index()
+    distinct_games["id"] = reserve_ids(session, DistinctGames, len(distinct_games))
+    distinct_games["snapshot_id"] = snapshot.id
+    distinct_games["format_id"] = snapshot.format_id
+
+    # Link 'analytics_games' to 'distinct_games' and assign its own ids
+    analytics_games = merge_dataframe(
+        analytics_games.reset_index(),
+        distinct_games[["tier", "id"]],
+        ["tier"],
+        "distinct_id",
+    ).sort_values("card_id")
+    analytics_games["id"] = reserve_ids(session, AnalyticsGames, len(analytics_games))
+    analytics_games["snapshot_id"] = snapshot.id
+    analytics_games["format_id"] = snapshot.format_id
+
+    # Confidence bounds, shrinkage and daily changes are computed once here
+    previous = read_previous_day(session, snapshot.id)
+    analytics_games[WIN_RATE_COLUMNS] = get_win_rate_stats(
+        analytics_games, distinct_games, previous
     )
 
-    # Write merged_df DataFrame to the 'AnalyticsGames' table
-    columns = ["card_id", "tier", "distinct_id", "games", "wins"]
-    write_dataframe(
-        session, "analytics_games", merged_df[columns].sort_values("card_id")
+    # Link 'analytics_distribution' to 'analytics_games'
+    analytics_distribution = merge_dataframe(
+        analytics_games[["id", "card_id", "tier"]],
+        analytics_distribution.reset_index(),
+        ["card_id", "tier"],
+        "games_id",
     )
 
-    # Retrieve records written on the previous step
-    latest_records = retrieve_latest(session, AnalyticsGames)
+    # Write the relevant columns of each table
+    columns = ["id", "snapshot_id", "format_id", "tier", "total"]
+    write_dataframe(session, "distinct_games", distinct_games[columns])
+    columns = [
+        "id",
+        "snapshot_id",
+        "format_id",
+        "card_id",
+        "tier",
+        "distinct_id",
+        "games",
+        "wins",
+        *WIN_RATE_COLUMNS,
+    ]
+    write_dataframe(session, "analytics_games", analytics_games[columns])
+    columns = ["games_id", "copies", "played"]
+    write_dataframe(session, "analytics_distribution", analytics_distribution[columns])
+
+    return snapshot.id, distinct_games, analytics_games, analytics_distribution
+
+
+def write_archetypes(session, codes, archetype_ids=None):
+    """
+    Returns the ids of archetype codes keyed by code,
+    inserting the codes that weren't seen before
+    """
+    if archetype_ids is not None and set(codes) <= set(archetype_ids.index):
+        return archetype_ids
+
+    def read_archetypes():
+        return pd.read_sql(
+            select(Archetype.code, Archetype.id), session.connection(), index_col="code"
+        ).id
+
+    existing = read_archetypes()
+    missing = sorted(set(codes) - set(existing.index))
+    if missing:
+        session.execute(insert(Archetype), [{"code": code} for code in missing])
+        existing = read_archetypes()
+
+    return existing
+
+
+@instrument
+def write_archetype_analytics(session, snapshot_id, format_id):
+    """
+    Streams the statistics of every archetype of a format to the database
+    in batches, so memory stays bounded however many archetypes there are.
+    Returns the number of rows written
+    """
+    archetype_ids, rows = None, 0
+    transforms = {
+        "distinct": ("archetype_distinct_games", get_archetype_distinct_games),
+        "games": ("archetype_games", get_archetype_games),
+    }
+
+    for kind, columns in stream_archetypes(format_id):
+        archetype_ids = write_archetypes(session, columns["archetype"], archetype_ids)
+
+        tablename, transform = transforms[kind]
+        batch = transform(columns, archetype_ids)
+        batch["snapshot_id"] = snapshot_id
+        batch["format_id"] = int(format_id)
+        write_dataframe(session, tablename, batch)
+        rows += len(batch)
+
+    return rows
+
+
+@instrument
+def write_card_snapshot_stats(session, snapshot_id, *analytics, card_dataframes=None):
+    """Writes the denormalized statistics of a snapshot"""
+    # Card tables are only read back when they weren't written in this run
+    if card_dataframes is None:
+        card, card_type, card_cost = read_card_information(session.connection())
+    else:
+        card, card_type, _, card_cost, _ = card_dataframes
+
+    attributes = get_card_attributes(card, card_type, card_cost)
+    stats = get_card_snapshot_stats(*analytics, attributes)
+    stats["snapshot_id"] = snapshot_id
+
+    write_dataframe(session, "card_snapshot_stats", stats)
+
+    return stats
+
+
+@instrument
+def write_histogram_cube(session, snapshot_id, format_id, stats):
+    """Writes the win rate histogram cube of a snapshot"""
+    cube = get_histogram_cube(stats)
+    cube["snapshot_id"] = snapshot_id
+    cube["format_id"] = int(format_id)
+
+    write_dataframe(session, "win_rate_histogram_cube", cube)
+
+
+@instrument
+def write_daily_rollups(session, snapshot_id, stats):
+    """Adds the statistics of a snapshot to the rollups of its day"""
+    day, format_id = session.execute(
+        select(Snapshot.taken_at, Snapshot.format_id).where(Snapshot.id == snapshot_id)
+    ).one()
+    day = day.date()
+
+    rollups = {
+        "card_daily_stats": get_card_rollup(stats),
+        "attribute_daily_stats": get_attribute_rollup(stats),
+    }
+    for tablename, rollup in rollups.items():
+        # Only the rows of the same day and format can be added to
+        target = Base.metadata.tables[tablename]
+        columns = ["id", *KEYS[tablename], *MEASURES[tablename], "snapshots"]
+        kept = pd.read_sql(
+            select(*(target.c[name] for name in columns)).where(
+                target.c.day == day, target.c.format_id == format_id
+            ),
+            session.connection(),
+        )
 
-    # Merge the query result with 'analytics_distribution'
-    merged_df = merge_dataframe(
-        latest_records, analytics_distribution, ["card_id", "tier"], "games_id"
+        updated, inserted = merge_rollup(tablename, kept, rollup)
+        if len(updated):
+            bulk_update(session.connection(), tablename, updated)
+        if len(inserted):
+            inserted = inserted.assign(day=day, format_id=format_id)
+            write_dataframe(session, tablename, inserted)
+
+
+def write_pipeline_run(session, snapshot_id, stages):
+    """Writes the instrumented stages of a run along with its totals"""
+    # Downloads are counted by every open stage, so only outermost ones add up
+    outermost = stages[stages.parent.isna()]
+    total = stages[stages.stage == "main"]
+
+    run = PipelineRun(
+        snapshot_id=snapshot_id,
+        wall_seconds=float(total.wall_seconds.sum()),
+        cpu_seconds=float(total.cpu_seconds.sum()),
+        max_rss_bytes=get_max_rss(),
+        downloaded_bytes=int(outermost.downloaded_bytes.sum()),
     )
-
-    # Write the relevant columns to 'AnalyticsDistribution' table
-    columns = ["games_id", "copies", "played"]
-    write_dataframe(session, "analytics_distribution", merged_df[columns])
+    session.add(run)
+    session.flush()
+
+    write_dataframe(session, "pipeline_stage", stages.assign(run_id=run.id))
+
+
+def get_changed_inputs(format_ids, resident):
+    """
+    Returns the fingerprint of every input body, along with the keys
+    of those that changed since the resident state was built
+    """
+    fingerprints = {CACHE.key(keyword): fingerprint(keyword) for keyword in INPUTS}
+    for format_id in format_ids:
+        key = CACHE.key("analytics", format_id)
+        fingerprints[key] = fingerprint("analytics", format_id)
+
+    # Bodies that couldn't be fetched are never deemed unchanged
+    seen = resident.get("fingerprints", {})
+    changed = {
+        key
+        for key, current in fingerprints.items()
+        if current is None or seen.get(key) != current
+    }
+    return fingerprints, changed
+
+
+def run(engine, events=tuple(EVENTS), resident=None):
+    """
+    Runs every step of the pipeline for the latest format of each event,
+    returning the last snapshot it wrote. Given the 'resident' state of an
+    earlier run, steps whose inputs didn't change since are skipped
+    """
+    resident = {} if resident is None else resident
+    formats = request_formats(events)
+    format_ids = [format_id for format_id, _, _ in formats]
+    print(f"The current formats are {dict(zip(events, format_ids))}")
+
+    # Opt-in concurrent download of every endpoint
+    if os.getenv("UNTAPPED_PREFETCH"):
+        prefetch(format_ids)
+
+    fingerprints, changed = get_changed_inputs(format_ids, resident)
+    refresh_cards = "cards" not in resident or bool(changed & set(INPUTS))
+    ingested = [f for f in formats if CACHE.key("analytics", f[0]) in changed]
+    if not refresh_cards and not ingested:
+        print("No input changed since the last run")
+        return None
+
+    if not resident.get("migrated"):
+        create_all(engine)
+        migrate(engine, formats)
+        resident["migrated"] = True
+
+    # Every write of the run is committed at once, or not at all
+    archives = []
+    with unit_of_work(engine) as session:
+        if refresh_cards:
+            # Sets and cards are shared by every format
+            legal_sets = sorted({s for _, _, sets in formats for s in sets})
+
+            # Write existing sets
+            included_sets = write_set(session, legal_sets)
+            if included_sets:
+                print(f"The following sets were included: {included_sets}")
+            else:
+                print("No new sets were included")
+
+            # Only cards changed since the last run are written
+            written_cards = write_card(session.connection(), legal_sets)
+        else:
+            written_cards = resident["cards"]
+            print("Card sources are unchanged since the last run")
+
+        # Formats are transformed in parallel, then written one after the other
+        analytics_by_format = get_analytics_by_format([f for f, _, _ in ingested])
+
+        snapshot_id = None
+        for format_id, event, _ in ingested:
+            # Write analytics and their denormalized statistics
+            snapshot_id, *written_analytics = write_analytics(
+                session, format_id, event, analytics_by_format.pop(format_id)
+            )
+            stats = write_card_snapshot_stats(
+                session,
+                snapshot_id,
+                *written_analytics,
+                card_dataframes=written_cards,
+            )
+            write_histogram_cube(session, snapshot_id, format_id, stats)
+            write_archetype_analytics(session, snapshot_id, format_id)
+            write_daily_rollups(session, snapshot_id, stats)
+            archives.append((format_id, snapshot_id, written_analytics))
+
+    # Keep a columnar history of the committed snapshots for offline analysis
+    for format_id, snapshot_id, written_analytics in archives:
+        archive_run(format_id, snapshot_id, written_analytics)
+    if archives:
+        sources = [fingerprints[CACHE.key(keyword)] for keyword in INPUTS]
+        archive_cards(written_cards, sources, archives[0][1])
+
+    # Only committed inputs are remembered, so failed runs are retried whole
+    resident.update(fingerprints=fingerprints, cards=written_cards)
+
+    return snapshot_id
+
+
+def run_instrumented(engine, events, sink, resident=None):
+    """Runs the pipeline, keeping the figures of the run along the data"""
+    start_run(sink)
+    with stage("main"):
+        latest_snapshot = run(engine, events, resident)
+    stages = finish_run()
+
+    # Daemon runs that found nothing to ingest aren't recorded
+    if resident is None or latest_snapshot is not None:
+        with unit_of_work(engine) as closing_session:
+            write_pipeline_run(closing_session, latest_snapshot, stages)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrapes Untapped into MySQL")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="download every endpoint again, ignoring cached responses",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=MODES,
+        default=MODE,
+        help="record responses as fixtures or replay them without network",
+    )
+    parser.add_argument(
+        "--fixtures", default=FIXTURES_DIR, help="directory of recorded responses"
+    )
+    parser.add_argument(
+        "--events",
+        nargs="+",
+        default=EVENTS,
+        help="events whose latest format is ingested, e.g. Ladder Traditional_Ladder",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running on schedule, skipping steps whose inputs didn't change",
+    )
+    parser.add_argument(
+        "--schedule",
+        default=SCHEDULE,
+        help="seconds between daemon runs or a cron expression, e.g. '0 */6 * * *'",
+    )
+    arguments = parser.parse_args()
+    CACHE.refresh = arguments.refresh
+    set_mode(arguments.mode, arguments.fixtures)
+
     engine = get_engine()  # Create engine
     garantee_database(engine)  # Make sure 'untapped' db exists
 
-    with engine.connect() as open_connection:
-        create_all(engine)
-
-        Session = sessionmaker(bind=engine)
-        open_session = Session()
-
-        # Write existing sets
-        current_format, included_sets = write_set(open_session)
-        print(f"The current format is {current_format}")
-
-        # Include cards if there are new sets to include
-        if included_sets:
-            print(f"The following sets were included: {included_sets}")
-            write_card(open_connection)
-        else:
-            print("No new sets were included")
-
-        # Write analytics
-        write_analytics(open_session, current_format)
-
-        open_session.commit()
+    # Stages are reported as JSON lines, on stderr unless a log file is given
+    if os.getenv("UNTAPPED_TRACEMALLOC"):
+        tracemalloc.start()
+    metrics_log = os.getenv("UNTAPPED_METRICS_LOG")
+    sink = open(metrics_log, "a", encoding="utf-8") if metrics_log else sys.stderr
+
+    if not arguments.daemon:
+        run_instrumented(engine, tuple(arguments.events), sink)
+        sys.exit()
+
+    # The engine pool, card frames and localization stay in memory between runs
+    resident, health = {}, Health()
+    serve_health(health)
+
+    def job():
+        """Revalidates every body, then ingests whatever changed"""
+        clear_requests()
+        try:
+            run_instrumented(engine, tuple(arguments.events), sink, resident)
+        finally:
+            CACHE.refresh = False  # Only the first run ignores cached responses
+
+    run_forever(job, Schedule(arguments.schedule), health)
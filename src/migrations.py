@@ -0,0 +1,340 @@
+"""Brings databases created by earlier versions up to the current models"""
+
+from sqlalchemy import insert, inspect, select, text
+
+from card import COLOR_BITS, COLOR_IDENTITIES, TEXT_TABLES, get_fallback_ids
+from models import (
+    AnalyticsDistribution,
+    AnalyticsGames,
+    Base,
+    Card,
+    CardAbility,
+    CardDailyStats,
+    CardSubtype,
+    CardType,
+    ColorIdentity,
+    DistinctGames,
+)
+from winrate import WIN_RATE_COLUMNS
+
+
+# Values of each rolled up attribute, and the join they need
+ATTRIBUTE_VALUES = {
+    "type": (
+        "t.type",
+        "JOIN card_type AS ct ON ct.card_id = css.card_id "
+        "JOIN type AS t ON t.id = ct.type_id",
+    ),
+    "color_identity": ("css.color_identity", ""),
+    "rarity": ("css.rarity", ""),
+    "cmc": ("CAST(css.cmc AS CHAR)", ""),
+}
+
+
+def get_columns(connection, tablename):
+    """Returns the column names of an existing table"""
+    return {column["name"] for column in inspect(connection).get_columns(tablename)}
+
+
+def create_indexes(connection, *tables):
+    """Creates the indexes declared in the models when missing"""
+    for table in tables:
+        for index in table.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def add_snapshots(connection):
+    """
+    Adds 'snapshot_id' to analytics tables, backfilling one snapshot
+    for each 'distinct_games' write of earlier runs
+    """
+    if "snapshot_id" in get_columns(connection, "analytics_games"):
+        return
+
+    for tablename in ["distinct_games", "analytics_games"]:
+        connection.execute(
+            text(f"ALTER TABLE {tablename} ADD COLUMN snapshot_id INTEGER NULL")
+        )
+
+    # Each earlier run wrote all of its 'distinct_games' rows at once
+    connection.execute(
+        text(
+            "INSERT INTO snapshot (taken_at) "
+            "SELECT DISTINCT created_on FROM distinct_games ORDER BY created_on"
+        )
+    )
+    connection.execute(
+        text(
+            "UPDATE distinct_games SET snapshot_id = ("
+            "SELECT id FROM snapshot WHERE taken_at = distinct_games.created_on)"
+        )
+    )
+    connection.execute(
+        text(
+            "UPDATE analytics_games SET snapshot_id = ("
+            "SELECT snapshot_id FROM distinct_games "
+            "WHERE distinct_games.id = analytics_games.distinct_id)"
+        )
+    )
+
+    # SQLite can't add constraints to existing tables
+    if connection.dialect.name == "mysql":
+        for tablename in ["distinct_games", "analytics_games"]:
+            connection.execute(
+                text(
+                    f"ALTER TABLE {tablename} ADD FOREIGN KEY (snapshot_id) "
+                    "REFERENCES snapshot (id)"
+                )
+            )
+
+    print("Backfilled snapshots of earlier runs")
+
+
+def seed_color_identities(connection):
+    """Fills the color identity lookup table"""
+    existing = set(connection.execute(select(ColorIdentity.id)).scalars())
+    missing = [
+        {"id": mask, "name": name}
+        for mask, name in COLOR_IDENTITIES.items()
+        if mask not in existing
+    ]
+    if missing:
+        connection.execute(insert(ColorIdentity), missing)
+
+
+def add_card_colors(connection):
+    """Adds color mask and mana value to cards, computing them from their costs"""
+    if "color_mask" in get_columns(connection, "card"):
+        return
+
+    for column in ["color_mask", "cmc"]:
+        connection.execute(text(f"ALTER TABLE card ADD COLUMN {column} INTEGER NULL"))
+
+    # Each color appears at most once per card, so its bits can be summed
+    bits = " ".join(f"WHEN '{color}' THEN {bit}" for color, bit in COLOR_BITS.items())
+    connection.execute(
+        text(
+            "UPDATE card SET "
+            "color_mask = (SELECT COALESCE(SUM(CASE color "
+            f"{bits} ELSE 0 END), 0) "
+            "FROM card_cost WHERE card_cost.card_id = card.id), "
+            "cmc = (SELECT COALESCE(SUM(cost), 0) "
+            "FROM card_cost WHERE card_cost.card_id = card.id AND color <> 'X')"
+        )
+    )
+
+    print("Backfilled color mask and mana value of existing cards")
+
+
+def add_card_hashes(connection):
+    """
+    Adds the content hash of cards, left empty so
+    existing cards are rewritten once by the next sync
+    """
+    if "content_hash" in get_columns(connection, "card"):
+        return
+
+    connection.execute(
+        text("ALTER TABLE card ADD COLUMN content_hash VARCHAR(16) NULL")
+    )
+
+
+def add_formats(connection):
+    """
+    Adds the event of snapshots and the format of analytics rows,
+    earlier runs having ingested the 'Ladder' event only
+    """
+    if "format_id" in get_columns(connection, "analytics_games"):
+        return
+
+    # Snapshots backfilled in this run were created along with the column
+    if "event" not in get_columns(connection, "snapshot"):
+        connection.execute(
+            text("ALTER TABLE snapshot ADD COLUMN event VARCHAR(50) NULL")
+        )
+    connection.execute(text("UPDATE snapshot SET event = 'Ladder' WHERE event IS NULL"))
+
+    for tablename in ["distinct_games", "analytics_games"]:
+        connection.execute(
+            text(f"ALTER TABLE {tablename} ADD COLUMN format_id INTEGER NULL")
+        )
+        connection.execute(
+            text(
+                f"UPDATE {tablename} SET format_id = ("
+                "SELECT format_id FROM snapshot "
+                f"WHERE snapshot.id = {tablename}.snapshot_id)"
+            )
+        )
+
+    print("Backfilled formats of earlier snapshots")
+
+
+def add_legacy_formats(connection, formats):
+    """
+    Assigns the current 'Ladder' format to the snapshots of earlier runs,
+    which were taken before formats were recorded, once it is known
+    """
+    ladder = [format_id for format_id, event, _ in formats if event == "Ladder"]
+    legacy = connection.execute(
+        text(
+            "SELECT 1 FROM snapshot "
+            "WHERE format_id IS NULL AND event = 'Ladder' LIMIT 1"
+        )
+    ).first()
+    if not ladder or not legacy:
+        return
+
+    connection.execute(
+        text(
+            "UPDATE snapshot SET format_id = :format_id "
+            "WHERE format_id IS NULL AND event = 'Ladder'"
+        ),
+        {"format_id": int(ladder[0])},
+    )
+    for tablename in ["distinct_games", "analytics_games"]:
+        connection.execute(
+            text(
+                f"UPDATE {tablename} SET format_id = ("
+                "SELECT format_id FROM snapshot "
+                f"WHERE snapshot.id = {tablename}.snapshot_id) "
+                "WHERE format_id IS NULL"
+            )
+        )
+
+    # Rollups filled while the format was unknown only hold earlier snapshots
+    for tablename in ["card_daily_stats", "attribute_daily_stats"]:
+        connection.execute(
+            text(
+                f"UPDATE {tablename} SET format_id = :format_id "
+                "WHERE format_id IS NULL"
+            ),
+            {"format_id": int(ladder[0])},
+        )
+
+    print(f"Assigned the 'Ladder' format {ladder[0]} to earlier snapshots")
+
+
+def add_text_dictionaries(connection):
+    """
+    Moves the texts of card tables to their dictionary tables under
+    fallback ids, the next card sync rekeying legal cards by text id
+    """
+    moved = False
+    for tablename, name in TEXT_TABLES.items():
+        columns = get_columns(connection, tablename)
+        if name not in columns:
+            continue
+
+        if f"{name}_id" not in columns:
+            connection.execute(
+                text(f"ALTER TABLE {tablename} ADD COLUMN {name}_id BIGINT NULL")
+            )
+
+        dictionary = Base.metadata.tables[name]
+        stored = set(connection.execute(select(dictionary.c.id)).scalars())
+        texts = connection.execute(
+            text(f"SELECT DISTINCT {name} FROM {tablename} WHERE {name} IS NOT NULL")
+        )
+        texts = texts.scalars().all()
+        missing = [
+            {"id": int(text_id), name: value}
+            for text_id, value in zip(get_fallback_ids(texts), texts)
+            if text_id not in stored
+        ]
+        if missing:
+            connection.execute(insert(dictionary), missing)
+
+        connection.execute(
+            text(
+                f"UPDATE {tablename} SET {name}_id = ("
+                f"SELECT id FROM {name} WHERE {name}.{name} = {tablename}.{name})"
+            )
+        )
+        connection.execute(text(f"ALTER TABLE {tablename} DROP COLUMN {name}"))
+        moved = True
+
+    if moved:
+        print("Moved card texts to their dictionary tables")
+
+
+def add_daily_rollups(connection):
+    """
+    Fills the daily rollups from the snapshots of earlier runs,
+    the per attribute ones from the snapshots that have statistics.
+    Runs after 'add_legacy_formats' so rollups copy the assigned format
+    """
+    rolled_up = connection.execute(select(CardDailyStats.id).limit(1)).first()
+    ingested = connection.execute(select(AnalyticsGames.id).limit(1)).first()
+    if rolled_up or not ingested:
+        return
+
+    connection.execute(
+        text(
+            "INSERT INTO card_daily_stats "
+            "(day, format_id, card_id, tier, games, wins, total, snapshots) "
+            "SELECT DATE(s.taken_at), s.format_id, ag.card_id, ag.tier, "
+            "SUM(ag.games), SUM(ag.wins), SUM(d.total), COUNT(*) "
+            "FROM analytics_games AS ag "
+            "JOIN snapshot AS s ON ag.snapshot_id = s.id "
+            "LEFT JOIN distinct_games AS d ON ag.distinct_id = d.id "
+            "GROUP BY DATE(s.taken_at), s.format_id, ag.card_id, ag.tier"
+        )
+    )
+
+    for attribute, (value, join) in ATTRIBUTE_VALUES.items():
+        connection.execute(
+            text(
+                "INSERT INTO attribute_daily_stats (day, format_id, attribute, "
+                "value, tier, games, wins, titles, snapshots) "
+                f"SELECT DATE(s.taken_at), s.format_id, '{attribute}', {value}, "
+                "css.tier, SUM(css.games), SUM(css.wins), "
+                "COUNT(DISTINCT css.card_id), COUNT(DISTINCT css.snapshot_id) "
+                "FROM card_snapshot_stats AS css "
+                f"JOIN snapshot AS s ON css.snapshot_id = s.id {join} "
+                f"WHERE {value} IS NOT NULL "
+                f"GROUP BY DATE(s.taken_at), s.format_id, {value}, css.tier"
+            )
+        )
+
+    print("Backfilled daily rollups of earlier snapshots")
+
+
+def add_win_rate_stats(connection):
+    """
+    Adds the win rate bounds, shrinkage and daily changes, left empty
+    for earlier snapshots as their priors were never fitted
+    """
+    for tablename in ["analytics_games", "card_snapshot_stats"]:
+        columns = get_columns(connection, tablename)
+        for column in WIN_RATE_COLUMNS:
+            if column not in columns:
+                connection.execute(
+                    text(f"ALTER TABLE {tablename} ADD COLUMN {column} FLOAT NULL")
+                )
+
+
+def migrate(engine, formats=()):
+    """
+    Applies every migration, each one being a no-op once applied.
+    'formats' are the current ones, as returned by 'request_formats'
+    """
+    with engine.begin() as connection:
+        add_snapshots(connection)
+        seed_color_identities(connection)
+        add_card_colors(connection)
+        add_card_hashes(connection)
+        add_formats(connection)
+        add_legacy_formats(connection, formats)
+        add_text_dictionaries(connection)
+        add_daily_rollups(connection)
+        add_win_rate_stats(connection)
+        create_indexes(
+            connection,
+            Card,
+            CardType,
+            CardSubtype,
+            CardAbility,
+            DistinctGames,
+            AnalyticsGames,
+            AnalyticsDistribution,
+        )
@@ -1,6 +1,18 @@
 """Defines untapped database tables through ORM"""
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    Float,
+    String,
+    Boolean,
+    Date,
+    DateTime,
+    Text,
+    ForeignKey,
+    Index,
+)
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
 
@@ -21,6 +33,17 @@ class Set(Base):
     cards = relationship("Card", backref="set")
 
 
+class ColorIdentity(Base):
+    """Color identity lookup table, keyed by WUBRG color mask"""
+
+    __tablename__ = "color_identity"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(20), nullable=False, unique=True)
+
+    cards = relationship("Card", backref="color_identity")
+
+
 class Card(Base):
     """Card table"""
 
@@ -38,6 +61,9 @@ class Card(Base):
     is_token = Column(Boolean)
     is_secondary_card = Column(Boolean)
     is_rebalanced = Column(Boolean)
+    color_mask = Column(Integer, ForeignKey("color_identity.id"), index=True)
+    cmc = Column(Integer, index=True)
+    content_hash = Column(String(16))
     created_on = Column(DateTime, server_default=func.now())
 
     types = relationship("CardType", backref="card")
@@ -47,6 +73,33 @@ class Card(Base):
     games = relationship("AnalyticsGames", backref="card")
 
 
+class Type(Base):
+    """Type dictionary, keyed by text id, negative for words without one"""
+
+    __tablename__ = "type"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    type = Column(String(100))
+
+
+class Subtype(Base):
+    """Subtype dictionary, keyed by text id, negative for words without one"""
+
+    __tablename__ = "subtype"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    subtype = Column(String(100))
+
+
+class Ability(Base):
+    """Ability dictionary, keyed by the smallest text id of each ability"""
+
+    __tablename__ = "ability"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    ability = Column(Text)
+
+
 class CardType(Base):
     """Card type table"""
 
@@ -54,7 +107,7 @@ class CardType(Base):
 
     id = Column(Integer, primary_key=True)
     card_id = Column(Integer, ForeignKey("card.id"))
-    type = Column(Text)
+    type_id = Column(BigInteger, ForeignKey("type.id"), index=True)
     created_on = Column(DateTime, server_default=func.now())
 
 
@@ -65,7 +118,7 @@ class CardSubtype(Base):
 
     id = Column(Integer, primary_key=True)
     card_id = Column(Integer, ForeignKey("card.id"))
-    subtype = Column(Text)
+    subtype_id = Column(BigInteger, ForeignKey("subtype.id"), index=True)
     created_on = Column(DateTime, server_default=func.now())
 
 
@@ -88,16 +141,34 @@ class CardAbility(Base):
 
     id = Column(Integer, primary_key=True)
     card_id = Column(Integer, ForeignKey("card.id"))
-    ability = Column(Text)
+    ability_id = Column(BigInteger, ForeignKey("ability.id"), index=True)
     created_on = Column(DateTime, server_default=func.now())
 
 
+class Snapshot(Base):
+    """Snapshot table, one row per analytics ingestion"""
+
+    __tablename__ = "snapshot"
+    __table_args__ = (Index("ix_snapshot_format_taken", "format_id", "taken_at"),)
+
+    id = Column(Integer, primary_key=True)
+    format_id = Column(Integer)  # 'Ladder' at upgrade for snapshots of old rows
+    event = Column(String(50))
+    taken_at = Column(DateTime, server_default=func.now())
+
+    distinct = relationship("DistinctGames", backref="snapshot")
+    games = relationship("AnalyticsGames", backref="snapshot")
+
+
 class DistinctGames(Base):
     """Distinct games table"""
 
     __tablename__ = "distinct_games"
+    __table_args__ = (Index("ix_distinct_games_snapshot_tier", "snapshot_id", "tier"),)
 
     id = Column(Integer, primary_key=True)
+    snapshot_id = Column(Integer, ForeignKey("snapshot.id"))
+    format_id = Column(Integer)
     tier = Column(String(10))
     total = Column(Integer)
     created_on = Column(DateTime, server_default=func.now())
@@ -109,13 +180,27 @@ class AnalyticsGames(Base):
     """Analytics games table"""
 
     __tablename__ = "analytics_games"
+    __table_args__ = (
+        Index(
+            "ix_analytics_games_snapshot_card_tier", "snapshot_id", "card_id", "tier"
+        ),
+        Index("ix_analytics_games_card_snapshot", "card_id", "snapshot_id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
+    snapshot_id = Column(Integer, ForeignKey("snapshot.id"))
+    format_id = Column(Integer)
     card_id = Column(Integer, ForeignKey("card.id"), nullable=False)
     tier = Column(String(10))
     distinct_id = Column(Integer, ForeignKey("distinct_games.id"), nullable=False)
     games = Column(Integer)
     wins = Column(Integer)
+    wilson_lower = Column(Float)
+    wilson_upper = Column(Float)
+    shrunk_winrate = Column(Float)
+    popularity = Column(Float)
+    winrate_delta = Column(Float)
+    popularity_delta = Column(Float)
     created_on = Column(DateTime, server_default=func.now())
 
     a_distribution = relationship("AnalyticsDistribution", backref="analytics_games")
@@ -125,6 +210,9 @@ class AnalyticsDistribution(Base):
     """Analytics distribution table"""
 
     __tablename__ = "analytics_distribution"
+    __table_args__ = (
+        Index("ix_analytics_distribution_games_copies", "games_id", "copies"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     games_id = Column(Integer, ForeignKey("analytics_games.id"), nullable=False)
@@ -133,6 +221,223 @@ class AnalyticsDistribution(Base):
     created_on = Column(DateTime, server_default=func.now())
 
 
+class CardSnapshotStats(Base):
+    """Denormalized statistics of each card and tier per snapshot"""
+
+    __tablename__ = "card_snapshot_stats"
+    __table_args__ = (
+        Index("ix_card_snapshot_stats_snapshot_tier", "snapshot_id", "tier"),
+        Index("ix_card_snapshot_stats_snapshot_card", "snapshot_id", "card_id"),
+        Index("ix_card_snapshot_stats_snapshot_color", "snapshot_id", "color_mask"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    snapshot_id = Column(Integer, ForeignKey("snapshot.id"), nullable=False)
+    card_id = Column(Integer, nullable=False)
+    art_link = Column(String(100))
+    set_id = Column(String(3))
+    title = Column(String(100))
+    rarity = Column(String(20))
+    power = Column(Text)
+    toughness = Column(Text)
+    is_legendary = Column(String(3))
+    cmc = Column(Integer)
+    colors = Column(String(100))
+    color_mask = Column(Integer, ForeignKey("color_identity.id"))
+    color_identity = Column(String(20))
+    types = Column(String(100))
+    tier = Column(String(10))
+    unique = Column(Integer)
+    games = Column(Integer)
+    wins = Column(Integer)
+    copies_1 = Column(Integer)
+    copies_2 = Column(Integer)
+    copies_3 = Column(Integer)
+    copies_4 = Column(Integer)
+    wilson_lower = Column(Float)
+    wilson_upper = Column(Float)
+    shrunk_winrate = Column(Float)
+    popularity = Column(Float)
+    winrate_delta = Column(Float)
+    popularity_delta = Column(Float)
+
+
+class Archetype(Base):
+    """Archetype table, keyed by the archetype codes of the analytics JSON"""
+
+    __tablename__ = "archetype"
+
+    id = Column(Integer, primary_key=True)
+    code = Column(String(50), nullable=False, unique=True)
+    created_on = Column(DateTime, server_default=func.now())
+
+    distinct = relationship("ArchetypeDistinctGames", backref="archetype")
+    games = relationship("ArchetypeGames", backref="archetype")
+
+
+class ArchetypeDistinctGames(Base):
+    """Distinct games of each archetype and tier per snapshot"""
+
+    __tablename__ = "archetype_distinct_games"
+    __table_args__ = (
+        Index(
+            "ix_archetype_distinct_games_snapshot_archetype",
+            "snapshot_id",
+            "archetype_id",
+            "tier",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    snapshot_id = Column(Integer, ForeignKey("snapshot.id"), nullable=False)
+    format_id = Column(Integer)
+    archetype_id = Column(Integer, ForeignKey("archetype.id"), nullable=False)
+    tier = Column(String(10))
+    total = Column(Integer)
+    created_on = Column(DateTime, server_default=func.now())
+
+
+class ArchetypeGames(Base):
+    """Card statistics of each archetype and tier per snapshot"""
+
+    __tablename__ = "archetype_games"
+    __table_args__ = (
+        Index(
+            "ix_archetype_games_snapshot_archetype_card",
+            "snapshot_id",
+            "archetype_id",
+            "card_id",
+        ),
+        Index("ix_archetype_games_card_snapshot", "card_id", "snapshot_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    snapshot_id = Column(Integer, ForeignKey("snapshot.id"), nullable=False)
+    format_id = Column(Integer)
+    archetype_id = Column(Integer, ForeignKey("archetype.id"), nullable=False)
+    card_id = Column(Integer, ForeignKey("card.id"), nullable=False)
+    tier = Column(String(10))
+    games = Column(Integer)
+    wins = Column(Integer)
+    copies_1 = Column(Integer)
+    copies_2 = Column(Integer)
+    copies_3 = Column(Integer)
+    copies_4 = Column(Integer)
+    created_on = Column(DateTime, server_default=func.now())
+
+
+class CardDailyStats(Base):
+    """Statistics of each card and tier added up over the snapshots of a day"""
+
+    __tablename__ = "card_daily_stats"
+    __table_args__ = (
+        Index("ix_card_daily_stats_day_format", "day", "format_id"),
+        Index("ix_card_daily_stats_card_day", "card_id", "day"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    format_id = Column(Integer)
+    card_id = Column(Integer, ForeignKey("card.id"), nullable=False)
+    tier = Column(String(10))
+    games = Column(BigInteger)
+    wins = Column(BigInteger)
+    total = Column(BigInteger)
+    snapshots = Column(Integer)
+    created_on = Column(DateTime, server_default=func.now())
+
+
+class AttributeDailyStats(Base):
+    """
+    Statistics of the cards sharing a type, color identity, rarity
+    or mana value, per tier, added up over the snapshots of a day
+    """
+
+    __tablename__ = "attribute_daily_stats"
+    __table_args__ = (
+        Index("ix_attribute_daily_stats_day_format", "day", "format_id"),
+        Index("ix_attribute_daily_stats_attribute_day", "attribute", "value", "day"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    format_id = Column(Integer)
+    attribute = Column(String(20), nullable=False)
+    value = Column(String(100))
+    tier = Column(String(10))
+    games = Column(BigInteger)
+    wins = Column(BigInteger)
+    titles = Column(Integer)
+    snapshots = Column(Integer)
+    created_on = Column(DateTime, server_default=func.now())
+
+
+class WinRateHistogramCube(Base):
+    """
+    Cards in each 5% win rate bin of a snapshot for every combination of the
+    histogram filters, 'ALL' standing for an unfiltered tier or type
+    """
+
+    __tablename__ = "win_rate_histogram_cube"
+    __table_args__ = (
+        Index(
+            "ix_win_rate_histogram_cube_lookup",
+            "snapshot_id",
+            "games_min",
+            "tier",
+            "type",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    snapshot_id = Column(Integer, ForeignKey("snapshot.id"), nullable=False)
+    format_id = Column(Integer)
+    games_min = Column(Integer, nullable=False)
+    tier = Column(String(10), nullable=False)
+    type = Column(String(50), nullable=False)
+    set_id = Column(String(3))
+    rarity = Column(String(20))
+    is_legendary = Column(String(3))
+    cmc = Column(Integer)
+    color_mask = Column(Integer, ForeignKey("color_identity.id"))
+    bin = Column(Integer, nullable=False)
+    cards = Column(Integer)
+
+
+class PipelineRun(Base):
+    """Pipeline run table, with the totals of each run of 'main.py'"""
+
+    __tablename__ = "pipeline_run"
+
+    id = Column(Integer, primary_key=True)
+    snapshot_id = Column(Integer, ForeignKey("snapshot.id"))
+    wall_seconds = Column(Float)
+    cpu_seconds = Column(Float)
+    max_rss_bytes = Column(BigInteger)
+    downloaded_bytes = Column(BigInteger)
+    created_on = Column(DateTime, server_default=func.now())
+
+    stages = relationship("PipelineStage", backref="run")
+
+
+class PipelineStage(Base):
+    """Pipeline stage table, one row per instrumented call of a run"""
+
+    __tablename__ = "pipeline_stage"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(Integer, ForeignKey("pipeline_run.id"), nullable=False, index=True)
+    stage = Column(String(100))
+    parent = Column(String(100))
+    wall_seconds = Column(Float)
+    cpu_seconds = Column(Float)
+    rss_bytes = Column(BigInteger)
+    traced_bytes = Column(BigInteger)
+    downloaded_bytes = Column(BigInteger)
+    rows_in = Column(BigInteger)
+    rows_out = Column(BigInteger)
+
+
 def drop_all(engine):
     """Drop all tables related to connected engine"""
     Base.metadata.drop_all(engine)
@@ -1,11 +1,23 @@
 """Requests JSONs and their raw dataframes equivalents"""
 
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from time import sleep
+from math import nan
+from threading import Lock
+from time import monotonic, sleep
+import json
 import logging
+import os
 import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
 
+from cache import ResponseCache, CHUNK_SIZE
+from instrument import add_downloaded_bytes, instrument
+from jsonstream import JsonStream
+
 
 # Relevant data is found in two different URLs
 URLS = {
@@ -33,7 +45,6 @@ HEADERS = {
     "authority": "api.mtga.untapped.gg",
     "accept": "*/*",
     "accept-language": "en-US,en;q=0.9,pt;q=0.8",
-    "if-none-match": '"047066ff947f01e9e609ca4cf0d6c0a6"',
     "origin": "https://mtga.untapped.gg",
     "referer": "https://mtga.untapped.gg/",
     "sec-ch-ua": ('"Google Chrome";v="111", "Not(A:Brand";v="8",' '"Chromium";v="111"'),
@@ -50,27 +61,157 @@ HEADERS = {
 }
 
 
+# Bodies are kept on disk between runs and revalidated through their ETag
+CACHE = ResponseCache()
+
+# Minimum interval in seconds between two requests to the same host
+RATE_LIMIT = {"api": 2, "json": 2}
+
+# 'record' keeps every response in the fixtures directory,
+# 'replay' serves them from it without touching the network
+MODES = ["live", "record", "replay"]
+MODE = os.getenv("UNTAPPED_MODE", "live")
+FIXTURES_DIR = os.getenv("UNTAPPED_FIXTURES_DIR", "fixtures/untapped")
+
+# Rows of per archetype statistics held in memory before being yielded
+BATCH_SIZE = int(os.getenv("UNTAPPED_BATCH_SIZE", "100000"))
+
+# Events whose latest meta period is ingested, e.g. 'Ladder,Traditional_Ladder'
+EVENTS = os.getenv("UNTAPPED_EVENTS", "Ladder").split(",")
+
+
+def get_session():
+    """Returns a keep-alive session able to hold every endpoint concurrently"""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=len(ENDPOINTS)))
+    return session
+
+
+# One session per host, so connections are reused between requests
+SESSIONS = {url_kw: get_session() for url_kw in URLS}
+
+# Per host bookkeeping of the latest request time
+LAST_REQUEST = {url_kw: 0.0 for url_kw in URLS}
+LOCKS = {url_kw: Lock() for url_kw in URLS}
+
+
+def throttle(url_kw):
+    """Waits until the host rate limit allows another request"""
+    with LOCKS[url_kw]:
+        wait = LAST_REQUEST[url_kw] + RATE_LIMIT[url_kw] - monotonic()
+        if wait > 0:
+            sleep(wait)
+        LAST_REQUEST[url_kw] = monotonic()
+
+
+def set_mode(mode, directory=FIXTURES_DIR):
+    """
+    Switches between live requests and recording or replaying fixtures,
+    which are never evicted from their directory
+    """
+    global MODE  # pylint: disable=W0603
+
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {MODES}")
+
+    MODE = mode
+    if mode != "live":
+        CACHE.relocate(directory, max_bytes=float("inf"))
+    clear_requests()
+
+
+def clear_requests():
+    """Forgets the bodies fetched so far, so later requests revalidate them"""
+    fetch.cache_clear()
+    request.cache_clear()
+
+
 @lru_cache
-def request(keyword, send_headers=True, format_id=""):
-    """Returns JSON from the corresponding keyword"""
+@instrument
+def fetch(keyword, send_headers=True, format_id=""):
+    """Makes sure the corresponding keyword body is cached, returning its key"""
     url_kw, endpoint = ENDPOINTS[keyword]
     url = URLS[url_kw]
+    key = CACHE.key(keyword, format_id)
+
+    # Recorded bodies are served as they are, at full speed
+    if MODE == "replay":
+        if key not in CACHE.index:
+            logging.error("No recorded response for '%s' in %s", key, CACHE.directory)
+            return None
+        return key
 
     try:
-        sleep(2)  # Resonable interval betwween requests
+        throttle(url_kw)  # Resonable interval betwween requests to a host
+
+        # Validators of the cached body go along the usual request headers
+        headers = {**(HEADERS if send_headers else {}), **CACHE.validators(key)}
+        response = SESSIONS[url_kw].get(
+            url + endpoint + format_id, headers=headers, timeout=30, stream=True
+        )
 
-        if send_headers:
-            response = requests.get(url + endpoint + format_id, HEADERS, timeout=30)
-        else:
-            response = requests.get(url + endpoint + format_id, timeout=30)
+        # Unchanged bodies are served from disk, new ones are streamed to it
+        with response:
+            if response.status_code != 304:
+                response.raise_for_status()
+                size = CACHE.store(
+                    key,
+                    response.iter_content(CHUNK_SIZE),
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                )
+                add_downloaded_bytes(size)
 
     except requests.exceptions.RequestException:
         logging.exception("An error occurred while requesting JSON from URL: %s", url)
 
     else:
-        return response.json()
+        return key
+
+
+@lru_cache
+@instrument
+def request(keyword, send_headers=True, format_id=""):
+    """Returns JSON from the corresponding keyword"""
+    key = fetch(keyword, send_headers, format_id)
+
+    if key is not None:
+        with CACHE.open(key) as body:
+            return json.load(body)
+
+
+def fingerprint(keyword, format_id=""):
+    """
+    Returns what identifies the body of an endpoint, fetching it when
+    needed, or None when it couldn't be fetched
+    """
+    # Analytics are requested without headers wherever they are fetched
+    key = fetch(keyword, keyword != "analytics", format_id)
+    if key is None:
+        return None
+    return CACHE.fingerprint(key)
 
 
+def prefetch(format_ids=None):
+    """
+    Concurrently downloads every endpoint, filling the request cache
+    so later 'request_*' calls don't touch the network
+    """
+    with ThreadPoolExecutor(max_workers=len(ENDPOINTS)) as executor:
+        active = executor.submit(fetch, "active")
+        executor.submit(fetch, "cards")
+        executor.submit(fetch, "text")
+
+        # Analytics depends on the formats, unless they were given
+        if format_ids is None:
+            active.result()
+            format_ids = [format_id for format_id, _, _ in request_formats()]
+
+        for format_id in format_ids:
+            executor.submit(fetch, "analytics", False, format_id)
+
+
+@instrument
 def request_active():
     """Returns format_id ID and lists of standard legal sets"""
 
@@ -80,6 +221,28 @@ def request_active():
             return str(format_id["id"]), format_id["legal_sets"]
 
 
+@instrument
+def request_formats(events=tuple(EVENTS)):
+    """
+    Returns format_id, event name and legal sets of the
+    latest meta period of each event
+    """
+    latest = {}
+    for period in request("active"):
+        if period["event_name"] in events:
+            latest[period["event_name"]] = period
+
+    for event in set(events) - set(latest):
+        logging.warning("No active meta period for event '%s'", event)
+
+    return [
+        (str(latest[event]["id"]), event, latest[event]["legal_sets"])
+        for event in events
+        if event in latest
+    ]
+
+
+@instrument
 def request_cards(sets):
     """Returns raw card data frame"""
     raw_card = pd.DataFrame(request("cards"))
@@ -94,6 +257,7 @@ def request_cards(sets):
     return raw_card.set_index("grpid")
 
 
+@instrument
 def request_analytics(format_id):
     """Returns distinct games data frame and raw analytics data frame"""
     json = request("analytics", False, format_id)
@@ -104,6 +268,123 @@ def request_analytics(format_id):
     return distinct, raw_analytics
 
 
+class StatisticsBuffer:
+    """Growable columnar buffers of card statistics, one row per tier"""
+
+    def __init__(self):
+        self.card_id, self.games, self.wins = array("q"), array("q"), array("q")
+        self.copies, self.archetype, self.tier = array("d"), [], []
+
+    def __len__(self):
+        return len(self.card_id)
+
+    def append(self, card, archetype, tiers):
+        """Appends the statistics of each tier of a card and archetype"""
+        for code, (stats, *_) in tiers.items():
+            self.card_id.append(int(card))
+            self.archetype.append(archetype)
+            self.tier.append(code)
+            self.games.append(stats[0])
+            self.wins.append(stats[1])
+
+            # Pad missing copy counts so every row has four
+            played = [nan if x is None else x for x in stats[3][:4]]
+            self.copies.extend(played + [nan] * (4 - len(played)))
+
+    def columns(self):
+        """Returns the buffered rows as columnar arrays"""
+        return {
+            "card_id": np.frombuffer(self.card_id, dtype=np.int64),
+            "archetype": np.array(self.archetype, dtype=object),
+            "tier": np.array(self.tier, dtype=object),
+            "games": np.frombuffer(self.games, dtype=np.int64),
+            "wins": np.frombuffer(self.wins, dtype=np.int64),
+            "copies": np.frombuffer(self.copies, dtype=np.float64).reshape(-1, 4),
+        }
+
+
+@instrument
+def stream_analytics(format_id, archetype="ALL"):
+    """
+    Returns distinct games and card statistics of a single archetype as
+    columnar arrays, walking the analytics body one card at a time
+    """
+    key = fetch("analytics", False, format_id)
+
+    distinct = {"tier": [], "total": []}
+    buffer = StatisticsBuffer()
+
+    with CACHE.open(key) as body:
+        stream = JsonStream(body)
+        for section in stream.items():
+            # Statistics are nested as card, archetype and tier
+            if section == "data":
+                for card in stream.items():
+                    buffer.append(card, archetype, stream.value().get(archetype, {}))
+
+            # Unique games are nested as tier and archetype
+            elif section == "metadata":
+                for tier_name, archetypes in stream.value()["games"].items():
+                    if archetype in archetypes:
+                        distinct["tier"].append(tier_name)
+                        distinct["total"].append(archetypes[archetype])
+
+            else:
+                stream.value()
+
+    distinct = {
+        "tier": np.array(distinct["tier"], dtype=object),
+        "total": np.array(distinct["total"], dtype=np.int64),
+    }
+
+    return distinct, buffer.columns()
+
+
+def stream_archetypes(format_id, batch_size=BATCH_SIZE, skip=("ALL",)):
+    """
+    Yields distinct games and batches of card statistics of every archetype
+    but those in 'skip', tagged by kind, holding about 'batch_size' rows at once
+    """
+    key = fetch("analytics", False, format_id)
+    buffer = StatisticsBuffer()
+
+    with CACHE.open(key) as body:
+        stream = JsonStream(body)
+        for section in stream.items():
+            # Statistics are nested as card, archetype and tier
+            if section == "data":
+                for card in stream.items():
+                    for archetype, tiers in stream.value().items():
+                        if archetype not in skip:
+                            buffer.append(card, archetype, tiers)
+
+                    if len(buffer) >= batch_size:
+                        yield "games", buffer.columns()
+                        buffer = StatisticsBuffer()
+
+            # Unique games are nested as tier and archetype
+            elif section == "metadata":
+                distinct = {"archetype": [], "tier": [], "total": []}
+                for tier_name, archetypes in stream.value()["games"].items():
+                    for archetype, total in archetypes.items():
+                        if archetype not in skip:
+                            distinct["archetype"].append(archetype)
+                            distinct["tier"].append(tier_name)
+                            distinct["total"].append(total)
+                yield "distinct", {
+                    "archetype": np.array(distinct["archetype"], dtype=object),
+                    "tier": np.array(distinct["tier"], dtype=object),
+                    "total": np.array(distinct["total"], dtype=np.int64),
+                }
+
+            else:
+                stream.value()
+
+    if len(buffer):
+        yield "games", buffer.columns()
+
+
+@instrument
 def request_text():
     """Returns raw card text data frame"""
     raw_text = pd.DataFrame(request("text")).set_index("id")
@@ -115,6 +396,11 @@ def request_text():
     return raw_text
 
 
+# Fixtures are used from the start when configured through the environment
+if MODE != "live":
+    set_mode(MODE)
+
+
 if __name__ == "__main__":
     f_id, legal_sets = request_active()
     print(f_id, legal_sets)
@@ -0,0 +1,89 @@
+"""Daily rollups of snapshot statistics read by the time-series dashboard queries"""
+
+import numpy as np
+import pandas as pd
+
+from instrument import instrument
+from schema import apply_schema
+
+
+# Rows of a day are identified by these columns, along with the format
+KEYS = {
+    "card_daily_stats": ["card_id", "tier"],
+    "attribute_daily_stats": ["attribute", "value", "tier"],
+}
+
+# Counts are added up over the snapshots of a day, while titles keep the
+# most any snapshot had, as the same titles show up in every snapshot
+MEASURES = {
+    "card_daily_stats": {"games": "sum", "wins": "sum", "total": "sum"},
+    "attribute_daily_stats": {"games": "sum", "wins": "sum", "titles": "max"},
+}
+
+
+@instrument
+def get_card_rollup(stats):
+    """Returns the contribution of a snapshot to the daily card statistics"""
+    rollup = stats[["card_id", "tier", "games", "wins", "unique"]].rename(
+        columns={"unique": "total"}
+    )
+    return rollup.reset_index(drop=True)
+
+
+@instrument
+def get_attribute_rollup(stats):
+    """
+    Returns the contribution of a snapshot to the daily statistics of
+    each type, color identity, rarity and mana value
+    """
+    values = {
+        "type": stats.types.str.split(","),
+        "color_identity": stats.color_identity,
+        "rarity": stats.rarity,
+        "cmc": stats.cmc,
+    }
+
+    rollups = []
+    for attribute, value in values.items():
+        # Cards count towards each of their types
+        cards = (
+            stats[["card_id", "tier", "games", "wins"]]
+            .assign(value=value)
+            .explode("value")
+            .dropna(subset=["value"])
+            .astype({"value": str})
+        )
+        rollup = cards.groupby(["value", "tier"], observed=True).agg(
+            games=("games", "sum"), wins=("wins", "sum"), titles=("card_id", "nunique")
+        )
+        rollups.append(rollup.reset_index().assign(attribute=attribute))
+
+    return pd.concat(rollups, ignore_index=True)
+
+
+@instrument
+def merge_rollup(tablename, kept, rollup):
+    """
+    Adds the contribution of a snapshot to the rows kept for its day,
+    returning the rows to update and the rows to insert
+    """
+    keys, measures = KEYS[tablename], MEASURES[tablename]
+    merged = rollup.astype({"tier": str}).merge(
+        kept, on=keys, how="left", suffixes=("", "_kept")
+    )
+
+    for name, how in measures.items():
+        current = merged[name].astype(float)
+        previous = merged[f"{name}_kept"].astype(float)
+        if how == "sum":
+            merged[name] = current + previous.fillna(0)
+        else:
+            merged[name] = np.fmax(current, previous)
+    merged["snapshots"] = merged.snapshots.astype(float).fillna(0) + 1
+
+    found = merged.id.notna()
+    columns = [*keys, *measures, "snapshots"]
+    updated = merged.loc[found, ["id", *columns]].astype({"id": int})
+    inserted = merged.loc[~found, columns]
+
+    return apply_schema(tablename, updated), apply_schema(tablename, inserted)
@@ -0,0 +1,182 @@
+"""Interval and cron schedules of the daemon, along with its health endpoint"""
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+import json
+import logging
+import os
+import signal
+
+
+# Seconds between runs or a cron expression, e.g. '0 */6 * * *'
+SCHEDULE = os.getenv("UNTAPPED_SCHEDULE", "3600")
+HEALTH_PORT = int(os.getenv("UNTAPPED_HEALTH_PORT", "8051"))
+
+# Ranges of the five cron fields
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def parse_cron_field(field, low, high):
+    """Returns the values of a cron field, e.g. '*/15', '1-5' or '0,30'"""
+    values = set()
+    for part in field.split(","):
+        expression, _, step = part.partition("/")
+        if expression == "*":
+            start, stop = low, high
+        elif "-" in expression:
+            start, stop = map(int, expression.split("-"))
+        else:
+            start = stop = int(expression)
+            if step:
+                stop = high
+
+        if not low <= start <= stop <= high:
+            raise ValueError(f"Cron field '{field}' is out of {low}-{high}")
+        values.update(range(start, stop + 1, int(step or 1)))
+
+    return values
+
+
+class Schedule:
+    """Next run times of either a fixed interval or a cron expression"""
+
+    def __init__(self, expression=SCHEDULE):
+        self.expression = expression.strip()
+        self.interval, self.fields = None, None
+
+        if self.expression.isdigit():
+            self.interval = timedelta(seconds=int(self.expression))
+            return
+
+        fields = self.expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid schedule '{expression}'")
+        self.fields = [
+            parse_cron_field(field, low, high)
+            for field, (low, high) in zip(fields, CRON_FIELDS)
+        ]
+
+        # Days match either field when both are restricted, like cron does
+        self.any_day = "*" in (fields[2], fields[4])
+        self.fields[4] = {day % 7 for day in self.fields[4]}  # 7 is Sunday too
+
+    def matches_day(self, time):
+        """Checks whether a day is part of the schedule"""
+        days, months, weekdays = self.fields[2:]
+        if time.month not in months:
+            return False
+
+        # Python counts weekdays from Monday, cron from Sunday
+        day, weekday = time.day in days, (time.weekday() + 1) % 7 in weekdays
+        return day and weekday if self.any_day else day or weekday
+
+    def next_time(self, after):
+        """Returns the first run time strictly after a given time"""
+        if self.interval is not None:
+            return after + self.interval
+
+        minutes, hours = self.fields[:2]
+        time = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+        # Whole days and hours are skipped at once, so a few years are enough
+        limit = time + timedelta(days=5 * 366)
+        while time < limit:
+            if not self.matches_day(time):
+                time = time.replace(hour=0, minute=0) + timedelta(days=1)
+            elif time.hour not in hours:
+                time = time.replace(minute=0) + timedelta(hours=1)
+            elif time.minute not in minutes:
+                time += timedelta(minutes=1)
+            else:
+                return time
+
+        raise ValueError(f"Schedule '{self.expression}' never runs")
+
+
+class Health:
+    """Outcome of the latest runs, as reported by the health endpoint"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.state = {
+            "status": "starting",
+            "runs": 0,
+            "failures": 0,
+            "last_success": None,
+            "last_error": None,
+            "next_run": None,
+        }
+
+    def update(self, **changes):
+        """Records changes of the reported state"""
+        with self.lock:
+            self.state.update(changes)
+
+    def report(self):
+        """Returns a copy of the reported state"""
+        with self.lock:
+            return dict(self.state)
+
+
+class HealthHandler(BaseHTTPRequestHandler):
+    """Serves 'GET /health', failing while the latest run failed"""
+
+    health = None
+
+    def do_GET(self):  # pylint: disable=C0103
+        """Reports the health of the daemon as JSON"""
+        if self.path != "/health":
+            self.send_error(404)
+            return
+
+        report = self.health.report()
+        body = json.dumps(report, default=str).encode()
+        self.send_response(503 if report["status"] == "failing" else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        """Keeps health checks out of the logs"""
+
+
+def serve_health(health, port=HEALTH_PORT):
+    """Serves the health endpoint from a background thread"""
+    handler = type("Handler", (HealthHandler,), {"health": health})
+    server = ThreadingHTTPServer(("", port), handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving health checks on port {port}")
+    return server
+
+
+def run_forever(job, schedule, health, stop=None):
+    """
+    Runs a job now and then on schedule until SIGTERM or SIGINT, which
+    let the current run finish before returning
+    """
+    stop = stop or Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop.set())
+
+    next_run = datetime.now()
+    while not stop.is_set():
+        health.update(next_run=next_run)
+        if stop.wait(max((next_run - datetime.now()).total_seconds(), 0)):
+            break
+
+        try:
+            job()
+        except Exception as error:  # pylint: disable=W0703
+            logging.exception("Scheduled run failed")
+            failures = health.report()["failures"] + 1
+            health.update(status="failing", failures=failures, last_error=repr(error))
+        else:
+            health.update(status="ok", last_success=datetime.now())
+        health.update(runs=health.report()["runs"] + 1)
+
+        # Late runs aren't caught up, the schedule resumes from now
+        next_run = schedule.next_time(max(next_run, datetime.now()))
+
+    print("Stopped scheduled runs")
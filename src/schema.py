@@ -0,0 +1,100 @@
+"""Compact column types of the frames written to each table"""
+
+
+# Counts fit unsigned 32 bit integers, small quantities fit 8 bits and
+# repeated strings are stored once as categories
+SCHEMAS = {
+    "card": {
+        "set_id": "category",
+        "rarity": "category",
+        "power": "category",
+        "toughness": "category",
+        "is_legendary": "boolean",
+        "is_token": "boolean",
+        "is_secondary_card": "boolean",
+        "is_rebalanced": "boolean",
+        "color_mask": "UInt8",
+        "cmc": "UInt8",
+    },
+    # Card tables reference their texts, stored once in dictionary tables
+    "card_type": {"type_id": "Int64"},
+    "card_subtype": {"subtype_id": "Int64"},
+    "card_ability": {"ability_id": "Int64"},
+    "type": {"type": "category"},
+    "subtype": {"subtype": "category"},
+    "ability": {"ability": "category"},
+    "card_cost": {"color": "category", "cost": "UInt8"},
+    "distinct_games": {"tier": "category", "total": "UInt32"},
+    "analytics_games": {
+        "tier": "category",
+        "games": "UInt32",
+        "wins": "UInt32",
+        # Rates and their bounds don't need more than single precision
+        "wilson_lower": "float32",
+        "wilson_upper": "float32",
+        "shrunk_winrate": "float32",
+        "popularity": "float32",
+        "winrate_delta": "float32",
+        "popularity_delta": "float32",
+    },
+    "analytics_distribution": {"copies": "UInt8", "played": "UInt32"},
+    "archetype_distinct_games": {"tier": "category", "total": "UInt32"},
+    "archetype_games": {
+        "tier": "category",
+        "games": "UInt32",
+        "wins": "UInt32",
+        "copies_1": "UInt32",
+        "copies_2": "UInt32",
+        "copies_3": "UInt32",
+        "copies_4": "UInt32",
+    },
+    # Daily rollups add up the counts of many snapshots
+    "card_daily_stats": {
+        "tier": "category",
+        "games": "UInt64",
+        "wins": "UInt64",
+        "total": "UInt64",
+        "snapshots": "UInt32",
+    },
+    "attribute_daily_stats": {
+        "attribute": "category",
+        "tier": "category",
+        "games": "UInt64",
+        "wins": "UInt64",
+        "titles": "UInt32",
+        "snapshots": "UInt32",
+    },
+    "win_rate_histogram_cube": {
+        "games_min": "UInt32",
+        "tier": "category",
+        "type": "category",
+        "set_id": "category",
+        "rarity": "category",
+        "is_legendary": "category",
+        "cmc": "UInt8",
+        "color_mask": "UInt8",
+        "bin": "UInt8",
+        "cards": "UInt32",
+    },
+}
+
+
+def apply_schema(tablename, dataframe):
+    """Casts the columns of a data frame declared in the schema of a table"""
+    schema = SCHEMAS[tablename]
+    return dataframe.astype(
+        {name: dtype for name, dtype in schema.items() if name in dataframe}
+    )
+
+
+def validate_schema(tablename, dataframe):
+    """Raises when a data frame doesn't follow the schema of its table"""
+    for name, dtype in SCHEMAS.get(tablename, {}).items():
+        if name not in dataframe:
+            raise ValueError(f"Column '{name}' is missing from '{tablename}'")
+
+        if str(dataframe[name].dtype) != dtype:
+            raise ValueError(
+                f"Column '{name}' of '{tablename}' is "
+                f"{dataframe[name].dtype}, expected {dtype}"
+            )
@@ -0,0 +1,260 @@
+"""In-process read service answering the dashboard filters from the latest snapshot"""
+
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from urllib.parse import parse_qsl, urlsplit
+import argparse
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+
+from card import COLOR_IDENTITIES
+from database import get_engine
+from models import CardSnapshotStats, Snapshot
+
+
+# Results kept per service and the port it listens to
+QUERY_CACHE_SIZE = int(os.getenv("UNTAPPED_QUERY_CACHE_SIZE", "256"))
+SERVICE_PORT = int(os.getenv("UNTAPPED_SERVICE_PORT", "8050"))
+
+# Filters of the dashboard queries, with the type of their values
+FILTERS = {
+    "games": int,
+    "tier": str,
+    "set": str,
+    "rarity": str,
+    "legendary": str,
+    "color": str,
+    "color_identity": str,
+    "type": str,
+    "cmc": int,
+    "title": str,
+}
+
+# Filters comparing a column for equality, and the column they compare
+EQUALITY_FILTERS = {
+    "tier": "tier",
+    "set": "set_id",
+    "rarity": "rarity",
+    "legendary": "is_legendary",
+    "cmc": "cmc",
+}
+
+# Columns describing a card rather than one of its tiers
+ATTRIBUTES = [
+    "art_link",
+    "title",
+    "set_id",
+    "rarity",
+    "is_legendary",
+    "cmc",
+    "types",
+    "colors",
+    "color_mask",
+    "color_identity",
+]
+COPIES = ["copies_1", "copies_2", "copies_3", "copies_4"]
+
+
+def normalize_filters(filters):
+    """
+    Returns the filters holding a value as sorted pairs, so every
+    spelling of the same filter set shares one cache entry
+    """
+    normalized = []
+    for name, value in filters.items():
+        if name not in FILTERS:
+            raise ValueError(f"Unknown filter '{name}'")
+        if value is None or value == "":
+            continue
+
+        value = FILTERS[name](value)
+        if name in ("type", "title"):
+            value = value.lower()  # Both are matched regardless of case
+        normalized.append((name, value))
+
+    return tuple(sorted(normalized))
+
+
+class TextIndex:
+    """
+    Inverted index of a text column, matching patterns against its
+    distinct values once rather than against every row
+    """
+
+    def __init__(self, values):
+        self.codes, self.uniques = pd.factorize(values.fillna("").str.lower())
+        self.matches = {}
+
+        # Every token is matched up front, as the dashboard lists them
+        for token in {t for value in self.uniques for t in re.split("[ ,]+", value)}:
+            if token:
+                self.contains(token)
+
+    def contains(self, pattern):
+        """Returns the rows whose value contains a lower case pattern"""
+        if pattern not in self.matches:
+            matched = [pattern in value for value in self.uniques]
+            self.matches[pattern] = np.array(matched, dtype=bool)
+
+        # Missing values are never matched, like SQL NULLs
+        return np.append(self.matches[pattern], False)[self.codes]
+
+
+class SnapshotView:
+    """Statistics of a snapshot held in memory, along with their filter indexes"""
+
+    def __init__(self, snapshot_id, stats):
+        self.snapshot_id = snapshot_id
+        self.stats = stats.reset_index(drop=True)
+        self.types = TextIndex(self.stats.types)
+        self.titles = TextIndex(self.stats.title)
+
+        # Colors overlap the mask, except 'Colorless' which has none
+        color_mask = self.stats.color_mask.to_numpy(dtype=float)
+        known, masks = ~np.isnan(color_mask), np.nan_to_num(color_mask).astype(int)
+        self.colors = {
+            name: known & ((masks & mask) > 0 if mask else masks == 0)
+            for mask, name in COLOR_IDENTITIES.items()
+        }
+        self.identities = {
+            name: known & (masks == mask) for mask, name in COLOR_IDENTITIES.items()
+        }
+
+    def mask(self, filters):
+        """Returns the rows matching every normalized filter"""
+        stats, mask = self.stats, np.ones(len(self.stats), dtype=bool)
+        nothing = np.zeros(len(self.stats), dtype=bool)
+
+        for name, value in filters:
+            if name == "games":
+                mask &= stats.games.to_numpy() >= value
+            elif name in EQUALITY_FILTERS:
+                mask &= (stats[EQUALITY_FILTERS[name]] == value).to_numpy()
+            elif name == "color":
+                mask &= self.colors.get(value, nothing)
+            elif name == "color_identity":
+                mask &= self.identities.get(value, nothing)
+            elif name == "type":
+                mask &= self.types.contains(value)
+            elif name == "title":
+                mask &= self.titles.contains(value)
+
+        return mask
+
+    def cards(self, filters):
+        """
+        Returns the statistics of each card over the tiers matching the
+        filters, like the 'latest_website_analytics' query
+        """
+        rows = self.stats[self.mask(filters)]
+        grouped = rows.groupby("card_id", sort=False)
+        totals = grouped[["games", "wins", "unique", *COPIES]].sum()
+
+        cards = grouped[ATTRIBUTES].first()
+        cards["cmc"] = cards.cmc.fillna(0).astype(int)
+        cards["winrate"] = totals.wins / totals.games
+        shrunk = (rows.shrunk_winrate * rows.games).groupby(rows.card_id, sort=False)
+        cards["shrunk_winrate"] = shrunk.sum() / totals.games
+        cards["popularity"] = totals.games / totals.unique
+        cards["games"] = totals.games
+        cards["copies"] = totals[COPIES].to_numpy().argmax(axis=1) + 1
+
+        return cards.sort_values("popularity", ascending=False)
+
+
+def load_view(connection, snapshot_id):
+    """Reads the statistics of a snapshot into a view"""
+    stats = pd.read_sql(
+        select(CardSnapshotStats).where(CardSnapshotStats.snapshot_id == snapshot_id),
+        connection,
+    )
+    return SnapshotView(snapshot_id, stats)
+
+
+class QueryService:
+    """
+    Answers dashboard filters from the latest snapshot of each event,
+    caching results until a newer snapshot is written
+    """
+
+    def __init__(self, engine, cache_size=QUERY_CACHE_SIZE):
+        self.engine = engine
+        self.views = {}
+        self.lock = Lock()
+        self.answer = lru_cache(maxsize=cache_size)(self.compute)
+
+    def latest_snapshot(self, connection, event):
+        """Returns the id of the latest snapshot of an event"""
+        return connection.execute(
+            select(func.max(Snapshot.id)).where(Snapshot.event == event)
+        ).scalar()
+
+    def refresh(self, event):
+        """Returns the view of an event, reloaded once a newer snapshot exists"""
+        with self.lock, self.engine.connect() as connection:
+            snapshot_id = self.latest_snapshot(connection, event)
+            view = self.views.get(event)
+            if view is None or view.snapshot_id != snapshot_id:
+                view = self.views[event] = load_view(connection, snapshot_id)
+                self.answer.cache_clear()
+                print(f"Loaded snapshot {snapshot_id} of '{event}'")
+        return view
+
+    def compute(self, snapshot_id, filters):
+        """Answers normalized filters from the view of a snapshot"""
+        for view in list(self.views.values()):
+            if view.snapshot_id == snapshot_id:
+                return view.cards(filters)
+        raise ValueError(f"Snapshot {snapshot_id} isn't loaded")
+
+    def cards(self, event="Ladder", **filters):
+        """Returns the statistics of the cards matching the dashboard filters"""
+        view = self.refresh(event)
+        return self.answer(view.snapshot_id, normalize_filters(filters)).copy()
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Serves 'GET /cards?tier=...' as JSON records"""
+
+    service = None
+
+    def do_GET(self):  # pylint: disable=C0103
+        """Answers the filters given as query parameters"""
+        url = urlsplit(self.path)
+        if url.path != "/cards":
+            self.send_error(404)
+            return
+
+        try:
+            cards = self.service.cards(**dict(parse_qsl(url.query)))
+        except ValueError as error:
+            self.send_error(400, str(error))
+            return
+
+        body = cards.reset_index().to_json(orient="records").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(service, port=SERVICE_PORT):
+    """Serves a query service over HTTP until interrupted"""
+    handler = type("Handler", (QueryHandler,), {"service": service})
+    with ThreadingHTTPServer(("", port), handler) as server:
+        print(f"Serving dashboard queries on port {port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    arguments = parser.parse_args()
+
+    serve(QueryService(get_engine()), arguments.port)
@@ -0,0 +1,130 @@
+"""Scales recorded fixtures into larger synthetic card pools and archetypes"""
+
+from copy import deepcopy
+import argparse
+import json
+
+from cache import ResponseCache
+
+
+def scale_cards(cards, texts, scale):
+    """
+    Returns cards and texts with 'scale' copies of every card, each
+    copy having its own ids and title so it is a distinct card
+    """
+    text_span = max(text["id"] for text in texts) + 1
+    grpid_span = max(card["grpid"] for card in cards) + 1
+    titles = {text["id"]: text for text in texts}
+
+    scaled_cards, scaled_texts, title_ids = list(cards), list(texts), {}
+    for copy in range(1, scale):
+        for card in cards:
+            title_id = card["titleId"] + copy * text_span
+            title_ids.setdefault(card["titleId"], []).append(title_id)
+
+            # Only titles need new texts, other text ids are shared
+            title = dict(titles.get(card["titleId"], {"text": "", "raw": None}))
+            title.update(id=title_id, text=f"{title['text']} #{copy}")
+            if title.get("raw"):
+                title["raw"] = f"{title['raw']} #{copy}"
+            scaled_texts.append(title)
+
+            scaled_cards.append(
+                dict(card, titleId=title_id, grpid=card["grpid"] + copy * grpid_span)
+            )
+
+    return scaled_cards, scaled_texts, title_ids
+
+
+def scale_archetype(archetype, copy, span):
+    """Returns the id of an archetype copy, numeric when the original is"""
+    if archetype.isdigit():
+        return str(int(archetype) + copy * span)
+    return f"{archetype}_{copy}"
+
+
+def scale_analytics(analytics, title_ids, scale):
+    """
+    Returns analytics with the statistics of every card copy and
+    'scale' copies of every archetype other than 'ALL'
+    """
+    # Copies of numeric archetypes are offset past the largest id
+    numeric = [
+        int(archetype)
+        for archetypes in analytics["metadata"]["games"].values()
+        for archetype in archetypes
+        if archetype.isdigit()
+    ]
+    span = max(numeric, default=0) + 1
+
+    def scale_archetypes(archetypes):
+        """Adds the copies of every archetype but 'ALL'"""
+        scaled = dict(archetypes)
+        for copy in range(1, scale):
+            for archetype, value in archetypes.items():
+                if archetype != "ALL":
+                    scaled[scale_archetype(archetype, copy, span)] = deepcopy(value)
+        return scaled
+
+    data = {}
+    for card_id, archetypes in analytics["data"].items():
+        data[card_id] = scale_archetypes(archetypes)
+        for title_id in title_ids.get(int(card_id), []):
+            data[str(title_id)] = deepcopy(data[card_id])
+
+    games = {
+        tier: scale_archetypes(archetypes)
+        for tier, archetypes in analytics["metadata"]["games"].items()
+    }
+
+    return dict(analytics, data=data, metadata=dict(analytics["metadata"], games=games))
+
+
+def load(cache, key):
+    """Reads a recorded body"""
+    with cache.open(key) as body:
+        return json.load(body)
+
+
+def store(cache, key, body):
+    """Records a body, without validators as it never came from Untapped"""
+    cache.store(key, [json.dumps(body).encode()])
+
+
+def generate(source, target, cards=10, archetypes=10):
+    """Writes fixtures of 'source' scaled by the given factors into 'target'"""
+    recorded = ResponseCache(source, max_bytes=float("inf"))
+    synthetic = ResponseCache(target, max_bytes=float("inf"))
+
+    scaled_cards, scaled_texts, title_ids = scale_cards(
+        load(recorded, "cards"), load(recorded, "text"), cards
+    )
+    store(synthetic, "cards", scaled_cards)
+    store(synthetic, "text", scaled_texts)
+    store(synthetic, "active", load(recorded, "active"))
+
+    for key in recorded.index:
+        if key.startswith("analytics-"):
+            analytics = scale_analytics(load(recorded, key), title_ids, archetypes)
+            store(synthetic, key, analytics)
+
+    print(
+        f"Wrote {len(scaled_cards)} cards with archetypes x{archetypes} to '{target}'"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("source", help="directory of recorded fixtures")
+    parser.add_argument("target", help="directory of the synthetic fixtures")
+    parser.add_argument("--scale", type=int, default=10, help="factor of both pools")
+    parser.add_argument("--cards", type=int, help="factor of the card pool")
+    parser.add_argument("--archetypes", type=int, help="factor of the archetypes")
+    arguments = parser.parse_args()
+
+    generate(
+        arguments.source,
+        arguments.target,
+        arguments.cards or arguments.scale,
+        arguments.archetypes or arguments.scale,
+    )
@@ -0,0 +1,97 @@
+"""Confidence bounds and shrinkage of card win rates, computed at ingest"""
+
+import numpy as np
+import pandas as pd
+
+from instrument import instrument
+
+
+# Normal quantile of the 95% Wilson score interval
+Z = 1.96
+
+# Strongest prior, used when win rates vary no more than sampling explains
+MAX_PRIOR_GAMES = 1e6
+
+# Columns computed for every card and tier
+WIN_RATE_COLUMNS = [
+    "wilson_lower",
+    "wilson_upper",
+    "shrunk_winrate",
+    "popularity",
+    "winrate_delta",
+    "popularity_delta",
+]
+
+
+def get_wilson_bounds(wins, games, z=Z):
+    """Returns the lower and upper Wilson score bounds of win rates"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = wins / games
+        denominator = 1 + z**2 / games
+        center = (rate + z**2 / (2 * games)) / denominator
+        margin = z * np.sqrt(rate * (1 - rate) / games + z**2 / (4 * games**2))
+        margin /= denominator
+
+    return center - margin, center + margin
+
+
+def get_beta_priors(wins, games, tiers):
+    """
+    Returns the mean and strength, in games, of a beta prior fitted per
+    tier by the method of moments, aligned with the given rows
+    """
+    rows = pd.DataFrame({"tier": tiers.to_numpy(), "wins": wins, "games": games})
+    rows = rows[rows.games > 0]
+    rows["rate"] = rows.wins / rows.games
+    grouped = rows.groupby("tier")
+
+    prior = grouped[["wins", "games"]].sum()
+    prior["mean"] = prior.wins / prior.games
+
+    # Only the spread beyond binomial noise is credited to the cards themselves
+    variance = prior["mean"] * (1 - prior["mean"])
+    noise = (1 / rows.games).groupby(rows.tier).mean() * variance
+    spread = grouped.rate.var() - noise
+    prior["strength"] = (variance / spread - 1).where(spread > 0, MAX_PRIOR_GAMES)
+    prior["strength"] = prior.strength.fillna(MAX_PRIOR_GAMES).clip(1, MAX_PRIOR_GAMES)
+
+    aligned = prior.reindex(tiers.to_numpy())
+    return aligned["mean"].to_numpy(), aligned.strength.to_numpy()
+
+
+@instrument
+def get_win_rate_stats(analytics_games, distinct_games, previous=None):
+    """
+    Returns the Wilson bounds, beta-binomial shrunk win rate, popularity and
+    changes since 'previous' of every card and tier, aligned with
+    'analytics_games'. 'previous' holds 'winrate' and 'popularity' of an
+    earlier day, indexed by card and tier
+    """
+    wins = analytics_games.wins.to_numpy(dtype=float)
+    games = analytics_games.games.to_numpy(dtype=float)
+    tiers = analytics_games.tier.astype(str)
+
+    stats = pd.DataFrame(index=analytics_games.index)
+    stats["wilson_lower"], stats["wilson_upper"] = get_wilson_bounds(wins, games)
+
+    # Cards with few games are pulled towards the win rate of their tier
+    mean, strength = get_beta_priors(wins, games, tiers)
+    stats["shrunk_winrate"] = (wins + mean * strength) / (games + strength)
+
+    totals = distinct_games.astype({"tier": str}).set_index("tier").total
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stats["popularity"] = games / tiers.map(totals).to_numpy(dtype=float)
+
+    if previous is None:
+        stats["winrate_delta"] = stats["popularity_delta"] = np.nan
+    else:
+        keys = pd.MultiIndex.from_arrays([analytics_games.card_id, tiers])
+        earlier = previous.reindex(keys)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stats["winrate_delta"] = wins / games - earlier.winrate.to_numpy()
+        stats["popularity_delta"] = (
+            stats.popularity.to_numpy() - earlier.popularity.to_numpy()
+        )
+
+    # Tiers without games have no popularity rather than an infinite one
+    return stats.replace([np.inf, -np.inf], np.nan).astype("float32")
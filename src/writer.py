@@ -0,0 +1,168 @@
+"""Bulk writers streaming data frames into existing database tables"""
+
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, column, insert, table, update
+
+from instrument import instrument
+from schema import validate_schema
+
+
+# Writing method and rows per batch can be tuned through environment variables
+# 'auto' uses LOAD DATA LOCAL INFILE whenever the server allows it
+WRITE_METHOD = os.getenv("UNTAPPED_WRITE_METHOD", "auto")
+CHUNK_SIZE = int(os.getenv("UNTAPPED_CHUNK_SIZE", "10000"))
+
+# Extension types holding booleans or strings, converted like objects
+TEXT_DTYPES = ["boolean", "category", "string"]
+
+# Characters that must be escaped inside LOAD DATA fields
+INFILE_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def local_infile_allowed(connection):
+    """Checks whether the server accepts LOAD DATA LOCAL INFILE"""
+    if connection.dialect.name != "mysql":
+        return False
+    return bool(int(connection.exec_driver_sql("SELECT @@local_infile").scalar()))
+
+
+def escape_field(value):
+    """Escapes special characters and converts booleans to integers"""
+    if isinstance(value, str):
+        return value.translate(INFILE_ESCAPES)
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    return value
+
+
+def write_tsv(dataframe, file):
+    """Writes a data frame in the TSV layout LOAD DATA reads by default"""
+    dataframe = dataframe.copy()
+
+    # Only booleans and strings need conversion before being written
+    for name, series in dataframe.items():
+        if series.dtype in (bool, object) or series.dtype.name in TEXT_DTYPES:
+            dataframe[name] = pd.Series(
+                [escape_field(value) for value in series], series.index, dtype=object
+            )
+
+    # Fields are escaped rather than quoted, as the statement encloses nothing
+    dataframe.to_csv(
+        file,
+        sep="\t",
+        header=False,
+        index=False,
+        na_rep="\\N",
+        lineterminator="\n",
+        quoting=csv.QUOTE_NONE,
+    )
+
+
+def write_infile(connection, tablename, dataframe):
+    """Streams a data frame as TSV into LOAD DATA LOCAL INFILE"""
+    with NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8") as file:
+        write_tsv(dataframe, file)
+        file.flush()
+
+        columns = ", ".join(f"`{name}`" for name in dataframe.columns)
+        result = connection.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{file.name}' INTO TABLE `{tablename}` "
+            "CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' "
+            "ENCLOSED BY '' ESCAPED BY '\\\\' "
+            f"LINES TERMINATED BY '\\n' ({columns})"
+        )
+
+    return result.rowcount
+
+
+def iter_chunks(dataframe, chunksize=CHUNK_SIZE):
+    """Yields the rows of a data frame as parameter dictionaries, in batches"""
+    # Drivers only escape native Python objects, with None for missing values
+    rows = dataframe.astype(object).where(dataframe.notna(), None)
+    columns = list(dataframe.columns)
+
+    for start in range(0, len(rows), chunksize):
+        chunk = rows.iloc[start : start + chunksize].to_numpy().tolist()
+        yield [dict(zip(columns, row)) for row in chunk]
+
+
+def write_executemany(connection, tablename, dataframe, chunksize=CHUNK_SIZE):
+    """Writes a data frame through batched multi-row inserts"""
+    statement = insert(table(tablename, *map(column, dataframe.columns)))
+
+    affected = 0
+    for chunk in iter_chunks(dataframe, chunksize):
+        connection.execute(statement, chunk)
+        affected += len(chunk)
+
+    return affected
+
+
+@instrument
+def bulk_write(
+    connection,
+    tablename,
+    dataframe,
+    index=False,
+    index_label=None,
+    method=WRITE_METHOD,
+    chunksize=CHUNK_SIZE,
+):
+    """Appends a data frame to a table, reporting the rows written per second"""
+    if index:
+        dataframe = dataframe.reset_index()
+        if index_label is not None:
+            dataframe = dataframe.rename(columns={dataframe.columns[0]: index_label})
+
+    # Frames of known tables must keep their compact types until written
+    validate_schema(tablename, dataframe)
+
+    if method == "auto":
+        method = "infile" if local_infile_allowed(connection) else "executemany"
+
+    start = perf_counter()
+    if method == "infile":
+        affected = write_infile(connection, tablename, dataframe)
+    else:
+        affected = write_executemany(connection, tablename, dataframe, chunksize)
+    elapsed = perf_counter() - start
+
+    rate = affected / elapsed if elapsed else float("inf")
+    print(
+        f"Table '{tablename}' had {affected} new inclusions "
+        f"({rate:.0f} rows/s through {method})"
+    )
+
+    return affected
+
+
+@instrument
+def bulk_update(connection, tablename, dataframe, index=False, key="id"):
+    """Updates the rows of a table whose key matches a data frame row"""
+    if index:
+        dataframe = dataframe.reset_index()
+
+    validate_schema(tablename, dataframe)
+
+    # Key parameter is renamed, as updated columns take their own names
+    target = table(tablename, *map(column, dataframe.columns))
+    statement = (
+        update(target)
+        .where(target.c[key] == bindparam(f"_{key}"))
+        .values({name: bindparam(name) for name in dataframe.columns if name != key})
+    )
+
+    affected = 0
+    for chunk in iter_chunks(dataframe.rename(columns={key: f"_{key}"})):
+        connection.execute(statement, chunk)
+        affected += len(chunk)
+
+    print(f"Table '{tablename}' had {affected} updated rows")
+
+    return affected
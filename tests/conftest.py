@@ -0,0 +1,7 @@
+"""Makes the pipeline modules importable the way 'src/main.py' imports them"""
+
+import os
+import sys
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
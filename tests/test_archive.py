@@ -0,0 +1,35 @@
+"""Tests of the columnar archive of runs"""
+
+import pandas as pd
+import pytest
+
+import archive
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def get_cards(title):
+    cards = pd.DataFrame({"id": [1], "title": [title]})
+    cards.name = "card"
+    return cards
+
+
+def test_card_frames_are_archived_once_per_version(archive_dir):
+    archive.archive_cards([get_cards("Opt")], [["cards", 1]], 1)
+    archive.archive_cards([get_cards("Opt")], [["cards", 1]], 2)
+    archive.archive_cards([get_cards("Shock")], [["cards", 2]], 3)
+
+    assert len(list(archive_dir.glob("cards/card/*/*.parquet"))) == 2
+    assert archive.read_cards("card", 2).title.tolist() == ["Opt"]
+    assert archive.read_cards("card").title.tolist() == ["Shock"]
+
+
+def test_reading_cards_before_any_version_fails():
+    archive.archive_cards([get_cards("Opt")], [["cards", 1]], 2)
+
+    with pytest.raises(ValueError):
+        archive.read_cards("card", 1)
@@ -0,0 +1,110 @@
+"""Tests of the disk backed response cache"""
+
+from itertools import count
+from multiprocessing import get_context
+import json
+
+import pytest
+
+import cache
+from cache import ResponseCache
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Makes every access strictly later than the previous one"""
+    ticks = count(1)
+    monkeypatch.setattr(cache, "time", lambda: float(next(ticks)))
+
+
+def open_repeatedly(directory, keys, times):
+    """Opens stored bodies from a forked process, as analytics workers do"""
+    cache = ResponseCache(directory)
+    for _ in range(times):
+        for key in keys:
+            cache.open(key).close()
+
+
+def test_forked_processes_share_the_index(tmp_path):
+    cache = ResponseCache(tmp_path)
+    keys = [f"analytics-{n}" for n in range(16)]
+    for key in keys:
+        cache.store(key, [b"{}"])
+
+    context = get_context("fork")
+    processes = [
+        context.Process(target=open_repeatedly, args=(tmp_path, keys, 20))
+        for _ in range(16)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0] * 16
+    assert set(json.loads((tmp_path / "index.json").read_text())) == set(keys)
+    assert not list(tmp_path.glob("index.*.tmp"))
+
+
+def test_index_keeps_entries_stored_by_other_processes(tmp_path):
+    first, second = ResponseCache(tmp_path), ResponseCache(tmp_path)
+    first.store("cards", [b"[]"])
+    second.store("text", [b"[]"])
+
+    assert set(ResponseCache(tmp_path).index) == {"cards", "text"}
+
+
+def test_directory_is_created_on_first_write(tmp_path):
+    cache = ResponseCache(tmp_path / "untapped")
+    assert not (tmp_path / "untapped").exists()
+
+    cache.store("cards", [b"[]"])
+    assert cache.path("cards").read_bytes() == b"[]"
+
+
+
+def test_validators_of_stored_entries_are_sent(tmp_path):
+    ResponseCache(tmp_path).store(
+        "cards", [b"[]"], etag='"v1"', last_modified="Sun, 18 Oct 2026 00:00:00 GMT"
+    )
+    stored = ResponseCache(tmp_path)
+
+    assert stored.validators("cards") == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Sun, 18 Oct 2026 00:00:00 GMT",
+    }
+    assert stored.validators("text") == {}
+
+    stored.refresh = True
+    assert stored.validators("cards") == {}
+
+
+def test_fingerprints_change_with_the_body(tmp_path):
+    stored = ResponseCache(tmp_path)
+    stored.store("cards", [b"[1]"])
+    first = stored.fingerprint("cards")
+
+    stored.store("cards", [b"[1]"])
+    assert stored.fingerprint("cards") == first
+
+    stored.store("cards", [b"[2]"])
+    assert stored.fingerprint("cards") != first
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    stored = ResponseCache(tmp_path, max_bytes=8)
+    for key in ["a", "b"]:
+        stored.store(key, [b"1234"])
+    stored.open("a").close()
+
+    stored.store("c", [b"1234"])
+    assert set(stored.index) == {"a", "c"}
+    assert not stored.path("b").exists()
+
+
+def test_entries_larger_than_the_cap_are_kept_alone(tmp_path):
+    stored = ResponseCache(tmp_path, max_bytes=8)
+    stored.store("a", [b"1234"])
+    stored.store("b", [b"0123456789"])
+
+    assert set(stored.index) == {"b"}
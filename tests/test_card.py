@@ -0,0 +1,85 @@
+"""Tests of the ids interning card texts into dictionary tables"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, insert
+
+from card import get_fallback_ids
+from main import write_texts
+from migrations import add_text_dictionaries
+from models import Base, CardType, Type
+
+
+def collide(monkeypatch):
+    """Makes every text hash to the same value"""
+    monkeypatch.setattr(
+        pd.util, "hash_array", lambda values: np.zeros(len(values), dtype=np.uint64)
+    )
+
+
+def test_fallback_ids_are_stable_and_negative():
+    ids = get_fallback_ids(["Elf", "Warrior", "Elf"])
+
+    assert ids[0] == ids[2] != ids[1]
+    assert (ids < 0).all()
+    assert (ids == get_fallback_ids(["Elf", "Warrior", "Elf"])).all()
+
+
+def test_fallback_ids_refuse_colliding_texts(monkeypatch):
+    collide(monkeypatch)
+
+    assert len(set(get_fallback_ids(["Elf", "Elf"]))) == 1
+    with pytest.raises(ValueError, match="share the ids"):
+        get_fallback_ids(["Elf", "Warrior"])
+
+
+def write_types(connection, types):
+    """Writes the dictionary rows of card types given as (id, type) pairs"""
+    ids, names = zip(*types)
+    rows = pd.DataFrame({"type_id": pd.array(ids, dtype="Int64"), "type": names})
+    write_texts(
+        connection, CardType.__table__, "type", rows.astype({"type": "category"})
+    )
+
+
+@pytest.fixture(name="connection")
+def fixture_connection():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        yield connection
+
+
+def test_write_texts_refuses_texts_sharing_an_id(connection):
+    with pytest.raises(ValueError, match="share the ids"):
+        write_types(connection, [(-1, "Elf"), (-1, "Warrior")])
+
+
+def test_write_texts_refuses_collisions_with_stored_texts(connection):
+    write_types(connection, [(-1, "Elf")])
+    connection.execute(insert(CardType), [{"card_id": 1, "type_id": -1}])
+
+    with pytest.raises(ValueError, match="collide"):
+        write_types(connection, [(-1, "Warrior")])
+
+
+def test_write_texts_rewords_untapped_ids(connection):
+    write_types(connection, [(1056, "Creature")])
+    connection.execute(insert(CardType), [{"card_id": 1, "type_id": 1056}])
+
+    write_types(connection, [(1056, "Creature Card"), (-5, "Elf")])
+    stored = connection.execute(Type.__table__.select().order_by(Type.id)).all()
+    assert [tuple(row) for row in stored] == [(-5, "Elf"), (1056, "Creature Card")]
+
+
+def test_migration_refuses_colliding_texts(connection, monkeypatch):
+    # Earlier versions stored the text itself in the card tables
+    connection.exec_driver_sql("ALTER TABLE card_type ADD COLUMN type TEXT NULL")
+    connection.exec_driver_sql(
+        "INSERT INTO card_type (card_id, type) VALUES (1, 'Elf'), (2, 'Warrior')"
+    )
+    collide(monkeypatch)
+
+    with pytest.raises(ValueError, match="share the ids"):
+        add_text_dictionaries(connection)
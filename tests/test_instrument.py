@@ -0,0 +1,39 @@
+"""Tests of the stage instrumentation of runs"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+from instrument import (
+    call_in_worker,
+    finish_run,
+    instrument,
+    merge_stages,
+    stage,
+    start_run,
+)
+
+
+@instrument
+def square(number):
+    """Stands for a transform run by worker processes"""
+    return [number**2]
+
+
+def test_stages_of_forked_workers_are_merged():
+    start_run()
+    with stage("main"):
+        with ProcessPoolExecutor(2, mp_context=get_context("fork")) as executor:
+            for _, stages in executor.map(partial(call_in_worker, square), [2, 3, 4]):
+                merge_stages(stages)
+    stages = finish_run()
+
+    workers = stages[stages.stage == "test_instrument.square"]
+    assert len(workers) == 3
+    assert workers.parent.tolist() == ["main"] * 3
+    assert workers.rows_out.tolist() == [1, 1, 1]
+    assert stages.stage.tolist().count("main") == 1
+
+
+def test_workers_outside_runs_record_nothing():
+    assert call_in_worker(square, 5) == ([25], [])
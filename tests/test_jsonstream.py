@@ -0,0 +1,74 @@
+"""Tests of the incremental JSON reader"""
+
+import io
+import json
+
+import pytest
+
+from jsonstream import JsonStream
+
+
+# Numbers, escapes and multi-byte characters that chunks can split anywhere
+DOCUMENT = {
+    "metadata": {"games": {"bronze": {"ALL": 70691, "12": 5}, "gold": {}}},
+    "data": {
+        "1000": {"ALL": {"b": [[2100, 9, 0, [63, 8, 61, None]]]}},
+        "1001": {"ALL": {"s": [[-1, 2.5e-3, 1.25, []]]}, "WU": {}},
+        "1002": {},
+    },
+    "text": 'Zoë é中\U0001f600 "quoted" \\ \n',
+    "empty": [],
+    "last": 123456789,
+}
+
+CHUNK_SIZES = [1, 2, 3, 7, 13, 2**20]
+
+
+def walk(stream):
+    """Reads 'DOCUMENT' back, walking the data one card at a time"""
+    document = {}
+    for section in stream.items():
+        if section == "data":
+            document[section] = {card: stream.value() for card in stream.items()}
+        else:
+            document[section] = stream.value()
+    return document
+
+
+def get_stream(document, chunk_size):
+    body = io.BytesIO(json.dumps(document, ensure_ascii=False, indent=1).encode())
+    return JsonStream(body, chunk_size)
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_document_is_read_whatever_the_chunk_size(chunk_size):
+    assert walk(get_stream(DOCUMENT, chunk_size)) == DOCUMENT
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_numbers_are_not_cut_at_chunk_ends(chunk_size):
+    stream = get_stream({"a": 1234567, "b": -0.5e10}, chunk_size)
+
+    assert {key: stream.value() for key in stream.items()} == {
+        "a": 1234567,
+        "b": -0.5e10,
+    }
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5])
+def test_empty_objects_have_no_items(chunk_size):
+    assert list(get_stream({}, chunk_size).items()) == []
+
+
+def test_truncated_documents_fail():
+    body = io.BytesIO(b'{"a": [1, 2')
+    stream = JsonStream(body, 3)
+
+    with pytest.raises(ValueError):
+        for _ in stream.items():
+            stream.value()
+
+
+def test_unexpected_values_fail():
+    with pytest.raises(ValueError):
+        list(JsonStream(io.BytesIO(b"[1]"), 1).items())
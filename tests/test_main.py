@@ -0,0 +1,33 @@
+"""Tests of the writes of a run sharing one unit of work"""
+
+import pytest
+from sqlalchemy import create_engine, event, insert, select
+
+from database import unit_of_work
+from main import write_set
+from models import Base, Card, Set
+
+
+@pytest.fixture(name="engine")
+def fixture_engine():
+    engine = create_engine("sqlite://")
+
+    # SQLite only enforces foreign keys when asked to, like InnoDB always does
+    @event.listens_for(engine, "connect")
+    def enforce_foreign_keys(connection, _):
+        connection.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def test_new_sets_exist_before_cards_reference_them(engine):
+    with unit_of_work(engine) as session:
+        assert write_set(session, ["ABC"]) == ["ABC"]
+        session.connection().execute(
+            insert(Card).values(id=1, art_link="a", title="Card", set_id="ABC")
+        )
+
+    with engine.connect() as connection:
+        assert connection.execute(select(Set.id)).scalars().all() == ["ABC"]
+        assert connection.execute(select(Card.set_id)).scalars().all() == ["ABC"]
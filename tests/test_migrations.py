@@ -0,0 +1,66 @@
+"""Tests of the migrations of databases written by earlier runs"""
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from migrations import add_daily_rollups, add_legacy_formats
+from models import Base
+
+
+LADDER = [("373", "Ladder", []), ("400", "Traditional_Ladder", [])]
+
+
+@pytest.fixture(name="connection")
+def fixture_connection():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        # A snapshot backfilled from the rows of a run that didn't record formats
+        connection.execute(
+            text("INSERT INTO snapshot (id, event) VALUES (1, 'Ladder')")
+        )
+        connection.execute(
+            text(
+                "INSERT INTO distinct_games (id, snapshot_id, tier) "
+                "VALUES (1, 1, 'ALL')"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO analytics_games (snapshot_id, card_id, tier, distinct_id) "
+                "VALUES (1, 1, 'ALL', 1)"
+            )
+        )
+        yield connection
+
+
+def get_format_ids(connection, tablename):
+    rows = connection.execute(text(f"SELECT format_id FROM {tablename}"))
+    return rows.scalars().all()
+
+
+def test_legacy_snapshots_get_the_ladder_format(connection):
+    add_legacy_formats(connection, LADDER)
+
+    for tablename in ["snapshot", "distinct_games", "analytics_games"]:
+        assert get_format_ids(connection, tablename) == [373]
+
+
+def test_legacy_snapshots_wait_for_a_ladder_format(connection):
+    add_legacy_formats(connection, LADDER[1:])
+
+    assert get_format_ids(connection, "snapshot") == [None]
+
+
+def test_rollups_copy_the_assigned_format(connection):
+    add_legacy_formats(connection, LADDER)
+    add_daily_rollups(connection)
+
+    assert get_format_ids(connection, "card_daily_stats") == [373]
+
+
+def test_rollups_filled_before_the_format_was_known_get_it(connection):
+    add_daily_rollups(connection)
+    add_legacy_formats(connection, LADDER)
+
+    assert get_format_ids(connection, "card_daily_stats") == [373]
@@ -0,0 +1,63 @@
+"""Tests of the requests to Untapped, revalidated against the response cache"""
+
+import pytest
+
+import raw
+from cache import ResponseCache
+
+
+class Response:
+    """Streamed response of a fake session"""
+
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code, self.body, self.headers = status_code, body, headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, _):
+        return [self.body]
+
+
+class Session:
+    """Answers requests in turn, remembering the headers they were sent with"""
+
+    def __init__(self, *responses):
+        self.responses, self.headers = list(responses), []
+
+    def get(self, _, headers, **__):
+        self.headers.append(headers)
+        return self.responses.pop(0)
+
+
+@pytest.fixture(name="session")
+def fixture_session(tmp_path, monkeypatch):
+    session = Session(
+        Response(200, b'[{"id": 1}]', {"ETag": '"v1"'}),
+        Response(304),
+    )
+    url_kw, _ = raw.ENDPOINTS["cards"]
+    monkeypatch.setattr(raw, "MODE", "live")
+    monkeypatch.setattr(raw, "CACHE", ResponseCache(tmp_path))
+    monkeypatch.setattr(raw, "throttle", lambda _: None)
+    monkeypatch.setitem(raw.SESSIONS, url_kw, session)
+
+    raw.clear_requests()
+    yield session
+    raw.clear_requests()
+
+
+def test_unchanged_bodies_are_revalidated_and_read_from_disk(session):
+    assert raw.request("cards") == [{"id": 1}]
+    assert "If-None-Match" not in session.headers[0]
+
+    raw.clear_requests()
+    assert raw.request("cards") == [{"id": 1}]
+    assert session.headers[1]["If-None-Match"] == '"v1"'
+    assert session.headers[1]["origin"] == raw.HEADERS["origin"]
@@ -0,0 +1,66 @@
+"""Tests of the interval and cron schedules of the daemon"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from scheduler import Schedule, parse_cron_field
+
+
+# A Sunday
+NOW = datetime(2026, 10, 18, 5, 30, 12)
+
+
+@pytest.mark.parametrize(
+    "field, low, high, values",
+    [
+        ("*", 1, 12, set(range(1, 13))),
+        ("*/15", 0, 59, {0, 15, 30, 45}),
+        ("1-5", 0, 23, {1, 2, 3, 4, 5}),
+        ("0,30", 0, 59, {0, 30}),
+        ("5/20", 0, 59, {5, 25, 45}),
+        ("10-20/5,59", 0, 59, {10, 15, 20, 59}),
+    ],
+)
+def test_cron_fields_are_expanded(field, low, high, values):
+    assert parse_cron_field(field, low, high) == values
+
+
+@pytest.mark.parametrize(
+    "field, low, high", [("60", 0, 59), ("0", 1, 31), ("5-2", 0, 59)]
+)
+def test_cron_fields_out_of_range_fail(field, low, high):
+    with pytest.raises(ValueError):
+        parse_cron_field(field, low, high)
+
+
+def test_intervals_are_added_to_the_last_time():
+    assert Schedule("3600").next_time(NOW) == NOW + timedelta(hours=1)
+
+
+@pytest.mark.parametrize(
+    "expression, after, expected",
+    [
+        ("0 */6 * * *", NOW, datetime(2026, 10, 18, 6, 0)),
+        ("0 */6 * * *", datetime(2026, 10, 18, 6, 0), datetime(2026, 10, 18, 12, 0)),
+        ("0 9 13 * *", NOW, datetime(2026, 11, 13, 9, 0)),
+        ("0 9 * * 5", NOW, datetime(2026, 10, 23, 9, 0)),
+        # Days match either field when both are restricted
+        ("0 9 19 * 5", NOW, datetime(2026, 10, 19, 9, 0)),
+        ("0 0 * * 7", datetime(2026, 10, 14), datetime(2026, 10, 18)),
+        ("0 0 * * 0", datetime(2026, 10, 14), datetime(2026, 10, 18)),
+        ("30 2 1 1 *", NOW, datetime(2027, 1, 1, 2, 30)),
+    ],
+)
+def test_cron_runs_at_the_next_matching_minute(expression, after, expected):
+    assert Schedule(expression).next_time(after) == expected
+
+
+def test_schedules_without_five_fields_fail():
+    with pytest.raises(ValueError):
+        Schedule("* * *")
+
+
+def test_schedules_that_never_run_fail():
+    with pytest.raises(ValueError):
+        Schedule("0 0 31 2 *").next_time(NOW)
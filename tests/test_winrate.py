@@ -0,0 +1,88 @@
+"""Tests of the confidence bounds and shrinkage of win rates"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from winrate import (
+    MAX_PRIOR_GAMES,
+    get_beta_priors,
+    get_wilson_bounds,
+    get_win_rate_stats,
+)
+
+
+@pytest.fixture(name="analytics_games")
+def fixture_analytics_games():
+    return pd.DataFrame(
+        {
+            "card_id": [1, 2, 3, 1, 2],
+            "tier": ["Gold", "Gold", "Gold", "Bronze", "Bronze"],
+            "wins": [60, 40, 1, 30, 0],
+            "games": [100, 100, 1, 60, 0],
+        }
+    )
+
+
+@pytest.fixture(name="distinct_games")
+def fixture_distinct_games():
+    return pd.DataFrame({"tier": ["Gold", "Bronze"], "total": [200, 0]})
+
+
+def test_wilson_bounds_match_the_score_interval():
+    lower, upper = get_wilson_bounds(np.array([5.0, 0.0]), np.array([10.0, 10.0]))
+
+    assert lower == pytest.approx([0.2366, 0.0], abs=1e-4)
+    assert upper == pytest.approx([0.7634, 0.2775], abs=1e-4)
+
+
+def test_wilson_bounds_narrow_with_games():
+    lower, upper = get_wilson_bounds(np.array([5.0, 500.0]), np.array([10.0, 1000.0]))
+
+    assert (upper - lower)[1] < (upper - lower)[0]
+    assert np.all(lower < 0.5) and np.all(upper > 0.5)
+
+
+def test_beta_prior_is_the_pooled_win_rate_of_each_tier():
+    wins, games = np.array([60.0, 40.0, 30.0]), np.array([100.0, 100.0, 60.0])
+    mean, strength = get_beta_priors(wins, games, pd.Series(["Gold", "Gold", "Bronze"]))
+
+    assert mean == pytest.approx([0.5, 0.5, 0.5])
+    assert strength[0] == strength[1] and 1 <= strength[0] < MAX_PRIOR_GAMES
+
+
+def test_beta_prior_is_strongest_without_spread_beyond_noise():
+    wins, games = np.array([50.0, 50.0]), np.array([100.0, 100.0])
+    _, strength = get_beta_priors(wins, games, pd.Series(["Gold", "Gold"]))
+
+    assert strength.tolist() == [MAX_PRIOR_GAMES] * 2
+
+
+def test_cards_with_few_games_are_pulled_towards_their_tier(
+    analytics_games, distinct_games
+):
+    stats = get_win_rate_stats(analytics_games, distinct_games)
+
+    assert stats.dtypes.unique().tolist() == [np.dtype("float32")]
+    assert stats.shrunk_winrate[2] < 0.6  # One win out of one game
+    assert 0.4 < stats.shrunk_winrate[1] < stats.shrunk_winrate[0] < 0.6
+
+
+def test_popularity_is_a_share_of_the_tier_games(analytics_games, distinct_games):
+    stats = get_win_rate_stats(analytics_games, distinct_games)
+
+    assert stats.popularity[:3].tolist() == pytest.approx([0.5, 0.5, 0.005])
+    assert stats.popularity[3:].isna().all()  # No 'Bronze' games at all
+    assert stats.winrate_delta.isna().all()
+
+
+def test_changes_are_relative_to_the_previous_day(analytics_games, distinct_games):
+    previous = pd.DataFrame(
+        {"winrate": [0.5], "popularity": [0.25]},
+        index=pd.MultiIndex.from_tuples([(1, "Gold")]),
+    )
+    stats = get_win_rate_stats(analytics_games, distinct_games, previous)
+
+    assert stats.winrate_delta[0] == pytest.approx(0.1)
+    assert stats.popularity_delta[0] == pytest.approx(0.25)
+    assert stats.winrate_delta[1:].isna().all()
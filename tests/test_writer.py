@@ -0,0 +1,53 @@
+"""Tests of the files streamed into LOAD DATA LOCAL INFILE"""
+
+import io
+import re
+
+import pandas as pd
+
+from writer import write_tsv
+
+
+# Sequences LOAD DATA unescapes with its default '\' escape character
+UNESCAPES = {"\\\\": "\\", "\\t": "\t", "\\n": "\n", "\\r": "\r", "\\0": "\0"}
+
+
+def read_tsv(text):
+    """Reads rows back the way LOAD DATA does with the statement's options"""
+    rows = []
+    for line in text.split("\n")[:-1]:
+        rows.append(
+            [
+                None
+                if field == "\\N"
+                else re.sub(r"\\(.)", lambda m: UNESCAPES.get(m[0], m[1]), field)
+                for field in line.split("\t")
+            ]
+        )
+    return rows
+
+
+def test_write_tsv_round_trips_special_characters():
+    titles = ['He said "hi"', "tab\there", "back\\slash", '"\t\\\n"', "\\N", None]
+    dataframe = pd.DataFrame({"id": range(len(titles)), "title": titles})
+
+    file = io.StringIO()
+    write_tsv(dataframe, file)
+
+    rows = read_tsv(file.getvalue())
+    assert [row[1] for row in rows] == titles
+    assert [int(row[0]) for row in rows] == list(range(len(titles)))
+
+
+def test_write_tsv_keeps_categories_and_booleans():
+    dataframe = pd.DataFrame(
+        {
+            "rarity": pd.Series(['Rare "promo"', None], dtype="category"),
+            "is_token": [True, False],
+        }
+    )
+
+    file = io.StringIO()
+    write_tsv(dataframe, file)
+
+    assert read_tsv(file.getvalue()) == [['Rare "promo"', "1"], [None, "0"]]